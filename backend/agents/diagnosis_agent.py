@@ -1,10 +1,11 @@
 from backend.med_model.model_loader import load_model
+from backend.med_model import triage_classifier
+from backend.med_model.prompts import PromptTemplate
+from backend.med_model.resilience import BackendUnavailable
 med_model = load_model("diagnosis")
 
 
-##actual diagnosis agent working
-def is_input_medical(input_text, task_type=None): 
-    prompt = f"""
+RELEVANCE_PROMPT = PromptTemplate("diagnosis.relevance", """
 You are a medical assistant. Analyze the following input and determine if it is medically relevant or not.
 
 Respond ONLY with:
@@ -12,11 +13,32 @@ Respond ONLY with:
 - "No" otherwise.
 
 Input: "{input_text}"
-"""
+""", task="diagnosis", truncatable=('input_text',))
+
+DIAGNOSIS_PROMPT = PromptTemplate("diagnosis.assessment", """
+You are an expert medical assistant. Read the following patient input and provide a detailed possible diagnosis.
+
+Patient input: "{input_text}"
+
+Return the response in a human-friendly paragraph.
+""", task="diagnosis", truncatable=('input_text',))
+
+
+##actual diagnosis agent working
+def is_input_medical(input_text, task_type=None):
+    decision = triage_classifier.predict_relevance(input_text)
+    if decision is not None:
+        print("[Verifier] local classifier decision:", decision)
+        return decision
+    return is_input_medical_llm(input_text)
+
+
+def is_input_medical_llm(input_text):
+    prompt = RELEVANCE_PROMPT.render(input_text=input_text)
     try:
-        response = med_model.generate_response(prompt).strip().lower()
-        print("[Verifier] model response:", response)
-        return response.startswith("yes")
+        result = med_model.classify_yes_no(prompt, profile="relevance")
+        print(f"[Verifier] model response: {result['answer']!r} ({result['decode_ms']:.0f} ms)")
+        return bool(result["decision"])
     except Exception as e:
         print(f"[Verifier] Error during input relevance check: {e}")
         return False
@@ -24,17 +46,14 @@ Input: "{input_text}"
 
 def generate_diagnosis(input_text):
     model = load_model("diagnosis")
-    prompt = f"""
-You are an expert medical assistant. Read the following patient input and provide a detailed possible diagnosis.
-
-Patient input: "{input_text}"
-
-Return the response in a human-friendly paragraph.
-"""
+    prompt = DIAGNOSIS_PROMPT.render(input_text=input_text)
     try:
         response = med_model.generate_response(prompt).strip()
         print("model response:", response)
         return response
+    except BackendUnavailable as e:
+        print(f"[Diagnosis] Model backend unavailable: {e}")
+        return "⚠️ The diagnosis service is temporarily unavailable. Please try again in a minute."
     except Exception as e:
         print(f"[Diagnosis] Error during diagnosis generation: {e}")
         return "⚠️ Sorry, there was an error generating the diagnosis."
@@ -1,16 +1,51 @@
+import io
+import re
+import time
+import argparse
+import json
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 import pandas as pd
-import matplotlib.pyplot as plt
+import numpy as np
 import seaborn as sns
 import os
-from datetime import datetime
+from datetime import datetime, timedelta
+from matplotlib.figure import Figure
+from PIL import Image
 from backend.med_model.model_loader import load_model
+from backend.med_model.scheduler import priority_scope
 
 
 
 HISTORY_PATH = "backend/patient_data/history.csv"
+HISTORY_ROLLUP_PATH = "backend/patient_data/history_rollup.csv"
+SUMMARY_STORE_PATH = "backend/patient_data/monitoring_summaries.json"
 REPORTS_DIR = "backend/reports/"
 os.makedirs(REPORTS_DIR, exist_ok=True)
 
+VITAL_COLUMNS = ["heart_rate", "temperature"]
+# Numeric vitals rolled up with mean/min/max/count on compaction. Other reading columns
+# (blood_pressure as "120/80", notes) keep their last value per bucket.
+NUMERIC_VITALS = VITAL_COLUMNS + ["respiratory_rate", "oxygen_saturation", "blood_glucose", "weight"]
+HISTORY_KEY_COLUMNS = ("patient_id", "timestamp", "resolution")
+VITAL_THRESHOLDS = {
+    "heart_rate": (50, 110),
+    "temperature": (35.0, 38.0)
+}
+CHART_MAX_POINTS = 500
+RECENCY_HALF_LIFE_HOURS = 72
+
+RAW_RETENTION_DAYS = 7
+HOURLY_RETENTION_DAYS = 90
+ROLLUP_STATS = ("min", "max", "count")
+INCREMENTAL_MAX_READINGS = 20
+BATCH_CHART_WORKERS = os.cpu_count() or 2
+BATCH_LLM_CONCURRENCY = 2
+
+# Serializes appends against compaction rewriting the raw file (single-process only).
+_history_lock = threading.Lock()
+_summary_lock = threading.Lock()
+
 
 
 def update_health_log(patient_id, vitals_dict):
@@ -19,48 +54,182 @@ def update_health_log(patient_id, vitals_dict):
         "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M"),
         **vitals_dict
     }])
-    if not os.path.exists(HISTORY_PATH):
-        df.to_csv(HISTORY_PATH, index=False)
-    else:
-        df.to_csv(HISTORY_PATH, mode='a', header=False, index=False)
+    with _history_lock:
+        if not os.path.exists(HISTORY_PATH):
+            df.to_csv(HISTORY_PATH, index=False)
+        else:
+            df.to_csv(HISTORY_PATH, mode='a', header=False, index=False)
+
+
+def read_history():
+    frames = []
+    if os.path.exists(HISTORY_ROLLUP_PATH):
+        frames.append(pd.read_csv(HISTORY_ROLLUP_PATH))
+    if os.path.exists(HISTORY_PATH):
+        raw = pd.read_csv(HISTORY_PATH)
+        raw["resolution"] = "raw"
+        frames.append(raw)
+    if not frames:
+        return None
+    # Rollup rows carry the bucket mean under the vital's own column name, so callers
+    # read mixed-resolution history exactly like raw readings.
+    df = pd.concat(frames, ignore_index=True)
+    df["timestamp"] = pd.to_datetime(df["timestamp"])
+    return df
 
 
-def analyze_patient_history(patient_id):
+def _vital_columns(df):
+    # (numeric vitals, other reading columns) present in df; ids, timestamps and rollup
+    # stat columns are neither.
+    stat_columns = {f"{vital}_{stat}" for vital in NUMERIC_VITALS for stat in ROLLUP_STATS}
+    numeric = [col for col in NUMERIC_VITALS if col in df.columns]
+    others = [col for col in df.columns
+              if col not in HISTORY_KEY_COLUMNS and col not in numeric and col not in stat_columns]
+    return numeric, others
+
+
+def _as_rollup_rows(raw, vitals, others):
+    rows = raw[["patient_id", "timestamp"]].copy()
+    for vital in vitals:
+        values = pd.to_numeric(raw[vital], errors="coerce")
+        rows[vital] = values
+        rows[f"{vital}_min"] = values
+        rows[f"{vital}_max"] = values
+        rows[f"{vital}_count"] = values.notna().astype(int)
+    for column in others:
+        rows[column] = raw[column]
+    return rows
+
+
+def compact_health_history(raw_days=RAW_RETENTION_DAYS, hourly_days=HOURLY_RETENTION_DAYS, now=None):
     if not os.path.exists(HISTORY_PATH):
-        return "No health data found.", None
+        return {"compacted": 0, "raw_rows": 0, "rollup_rows": 0}
+
+    now = pd.to_datetime(now) if now is not None else pd.Timestamp(datetime.now())
+    raw_cutoff = now - timedelta(days=raw_days)
+    hourly_cutoff = now - timedelta(days=hourly_days)
 
-    df = pd.read_csv(HISTORY_PATH)
-    df = df[df["patient_id"] == patient_id]
+    with _history_lock:
+        raw = pd.read_csv(HISTORY_PATH)
+        raw["timestamp"] = pd.to_datetime(raw["timestamp"])
+        expired = raw["timestamp"] < raw_cutoff
+        vitals, others = _vital_columns(raw)
+
+        rollups = _as_rollup_rows(raw[expired], vitals, others)
+        if os.path.exists(HISTORY_ROLLUP_PATH):
+            existing = pd.read_csv(HISTORY_ROLLUP_PATH)
+            existing["timestamp"] = pd.to_datetime(existing["timestamp"])
+            rollups = pd.concat([existing.drop(columns="resolution"), rollups], ignore_index=True)
+            existing_vitals, existing_others = _vital_columns(existing)
+            vitals = [col for col in NUMERIC_VITALS if col in set(vitals) | set(existing_vitals)]
+            others = list(dict.fromkeys(others + existing_others))
+        # "last" below must mean the latest reading in each bucket.
+        rollups = rollups.sort_values("timestamp", kind="stable")
+
+        is_daily = rollups["timestamp"] < hourly_cutoff
+        rollups["timestamp"] = rollups["timestamp"].dt.floor("h").where(~is_daily, rollups["timestamp"].dt.floor("D"))
+        rollups["resolution"] = np.where(is_daily, "day", "hour")
+        for vital in vitals:
+            # Weight bucket means by their counts so re-rolling hours into days stays exact.
+            rollups[f"{vital}_sum"] = rollups[vital] * rollups[f"{vital}_count"]
+
+        aggregated = rollups.groupby(["patient_id", "timestamp", "resolution"], as_index=False).agg({
+            **{f"{vital}_sum": "sum" for vital in vitals},
+            **{f"{vital}_min": "min" for vital in vitals},
+            **{f"{vital}_max": "max" for vital in vitals},
+            **{f"{vital}_count": "sum" for vital in vitals},
+            **{column: "last" for column in others}
+        })
+        for vital in vitals:
+            counts = aggregated[f"{vital}_count"]
+            aggregated[vital] = aggregated.pop(f"{vital}_sum") / counts.where(counts > 0)
+        columns = ["patient_id", "timestamp", "resolution"] + [
+            col for vital in vitals for col in (vital, *(f"{vital}_{stat}" for stat in ROLLUP_STATS))
+        ] + others
+        aggregated = aggregated[columns].sort_values(["patient_id", "timestamp"])
+        aggregated["timestamp"] = aggregated["timestamp"].dt.strftime("%Y-%m-%d %H:%M")
+
+        recent = raw[~expired].copy()
+        recent["timestamp"] = recent["timestamp"].dt.strftime("%Y-%m-%d %H:%M")
+        # Write-then-rename so a crash mid-compaction never leaves a truncated store.
+        aggregated.to_csv(HISTORY_ROLLUP_PATH + ".tmp", index=False)
+        recent.to_csv(HISTORY_PATH + ".tmp", index=False)
+        os.replace(HISTORY_ROLLUP_PATH + ".tmp", HISTORY_ROLLUP_PATH)
+        os.replace(HISTORY_PATH + ".tmp", HISTORY_PATH)
+
+    return {"compacted": int(expired.sum()), "raw_rows": len(recent), "rollup_rows": len(aggregated)}
+
+
+def load_patient_history(patient_id, start=None, end=None):
+    df = read_history()
+    if df is None:
+        return None
+
+    df = df[df["patient_id"] == patient_id].copy()
+    if start is not None:
+        df = df[df["timestamp"] >= pd.to_datetime(start)]
+    if end is not None:
+        df = df[df["timestamp"] <= pd.to_datetime(end)]
+    return df.sort_values("timestamp")
+
+
+def analyze_patient_history(patient_id, start=None, end=None, as_series=False):
+    df = load_patient_history(patient_id, start, end)
+    if df is None:
+        return "No health data found.", None
     if df.empty:
         return "No entries found for this patient.", None
-    summary = summarize_trends_llm(df)
-    chart_path = generate_health_chart(df, patient_id)
-    return summary, chart_path
+    # Windowed views summarize just that slice; the stored summary covers the full history.
+    summary = summarize_patient_trends(patient_id, df) if start is None and end is None else _summarize_window(df)
+    if as_series:
+        return summary, get_health_chart_series(df)
+    return summary, generate_health_chart(df, patient_id)
+
+
+def downsample_vitals(df, max_points=CHART_MAX_POINTS):
+    vitals = [col for col in VITAL_COLUMNS if col in df.columns]
+    if len(df) <= max_points:
+        return df[["timestamp", *vitals]]
+    # Equal-count buckets keep the shape of the trend while capping what gets drawn or serialized.
+    buckets = np.arange(len(df)) * max_points // len(df)
+    return (
+        df[["timestamp", *vitals]]
+        .groupby(buckets)
+        .agg({"timestamp": "first", **{col: "mean" for col in vitals}})
+        .reset_index(drop=True)
+    )
 
 
+def get_health_chart_series(df, max_points=CHART_MAX_POINTS):
+    # Long format for gr.LinePlot(x="timestamp", y="value", color="vital").
+    sampled = downsample_vitals(df, max_points)
+    return sampled.melt(id_vars="timestamp", var_name="vital", value_name="value").dropna()
 
-def generate_health_chart(df, patient_id):
+
+def generate_health_chart(df, patient_id, max_points=CHART_MAX_POINTS):
+    df = df.copy()
     df['timestamp'] = pd.to_datetime(df['timestamp'])
+    df = downsample_vitals(df.sort_values('timestamp'), max_points)
 
-    plt.figure(figsize=(10, 5))
+    # A standalone Figure (not pyplot) keeps concurrent renders from sharing global state.
+    fig = Figure(figsize=(10, 5))
+    ax = fig.subplots()
     if 'heart_rate' in df.columns:
-        sns.lineplot(x='timestamp', y='heart_rate', data=df, label='Heart Rate')
+        sns.lineplot(x='timestamp', y='heart_rate', data=df, label='Heart Rate', ax=ax)
     if 'temperature' in df.columns:
-        sns.lineplot(x='timestamp', y='temperature', data=df, label='Temperature')
-    if 'blood_pressure' in df.columns:
-        pass  # You can add logic to visualize blood_pressure if it’s structured
-
-    plt.title(f"Vitals Trend: {patient_id}")
-    plt.xlabel("Time")
-    plt.ylabel("Value")
-    plt.xticks(rotation=30)
-    plt.legend()
-    plt.tight_layout()
-
-    chart_path = os.path.join(REPORTS_DIR, f"{patient_id}_monitoring_chart.png")
-    plt.savefig(chart_path)
-    plt.close()
-    return chart_path
+        sns.lineplot(x='timestamp', y='temperature', data=df, label='Temperature', ax=ax)
+
+    ax.set_title(f"Vitals Trend: {patient_id}")
+    ax.set_xlabel("Time")
+    ax.set_ylabel("Value")
+    ax.tick_params(axis='x', labelrotation=30)
+    ax.legend()
+    fig.tight_layout()
+
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="png")
+    buffer.seek(0)
+    return Image.open(buffer)
 
 def summarize_trends_llm(df):
     if not isinstance(df, pd.DataFrame):
@@ -68,7 +237,7 @@ def summarize_trends_llm(df):
 
     model = load_model("monitoring")
     try:
-        recent = df.tail(3).to_dict(orient="records")
+        recent = _format_readings(df.tail(3))
     except Exception as e:
         return f"⚠️ Error extracting recent data: {e}"
     prompt = (
@@ -84,12 +253,285 @@ def summarize_trends_llm(df):
         return f"⚠️ LLM Error: {e}"
 
 
-def generate_monitoring_report(patient_id: str) -> str:
-    if not os.path.exists(HISTORY_PATH):
-        return "❌ No health data available."
+def _summarize_window(df):
+    model = load_model("monitoring")
+    prompt = (
+        "You are a medical assistant. Analyze the following health logs and summarize the patient's condition over this period.\n\n"
+        f"{_format_readings(df.tail(INCREMENTAL_MAX_READINGS))}\n\n"
+        "Provide any patterns, improvements, or worsening symptoms."
+    )
+    try:
+        return model.generate_response(prompt).strip()
+    except Exception as e:
+        return f"⚠️ LLM Error: {e}"
+
+
+def _format_readings(df):
+    records = []
+    for record in df.drop(columns=["patient_id"], errors="ignore").to_dict(orient="records"):
+        record["timestamp"] = pd.Timestamp(record["timestamp"]).strftime("%Y-%m-%d %H:%M")
+        records.append({key: value for key, value in record.items() if not pd.isna(value)})
+    return records
+
+
+def _load_summary_store():
+    if not os.path.exists(SUMMARY_STORE_PATH):
+        return {}
+    with open(SUMMARY_STORE_PATH, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _save_summary(patient_id, entry):
+    # JSON object keys are strings, while read_csv gives integer patient ids; key on str()
+    # on both sides so the stored summary is found again.
+    with _summary_lock:
+        store = _load_summary_store()
+        store[str(patient_id)] = entry
+        with open(SUMMARY_STORE_PATH + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(store, f, indent=2)
+        os.replace(SUMMARY_STORE_PATH + ".tmp", SUMMARY_STORE_PATH)
+
+
+def _data_version(df):
+    last = df["timestamp"].max()
+    # Readings are logged at minute resolution, so also count rows sharing the last minute.
+    return last.strftime("%Y-%m-%d %H:%M"), int((df["timestamp"] == last).sum())
+
+
+def summarize_patient_trends(patient_id, df):
+    last_timestamp, rows_at_last = _data_version(df)
+    entry = _load_summary_store().get(str(patient_id))
+
+    if entry and (entry["last_timestamp"], entry["rows_at_last"]) == (last_timestamp, rows_at_last):
+        return entry["summary"]
 
-    df = pd.read_csv(HISTORY_PATH)
-    df = df[df["patient_id"] == patient_id]
+    if entry:
+        previous_last = pd.to_datetime(entry["last_timestamp"])
+        new_readings = df[df["timestamp"] > previous_last]
+        if last_timestamp == entry["last_timestamp"]:
+            new_readings = df[df["timestamp"] == previous_last].tail(max(rows_at_last - entry["rows_at_last"], 0))
+        if new_readings.empty:
+            # Nothing past the watermark (e.g. older rows were compacted or a shorter window
+            # was passed in): the stored summary still covers everything in df.
+            return entry["summary"]
+        summary = _update_summary_llm(entry["summary"], new_readings)
+    else:
+        summary = summarize_trends_llm(df)
+
+    if not summary.startswith("⚠️"):
+        _save_summary(patient_id, {
+            "summary": summary,
+            "last_timestamp": last_timestamp,
+            "rows_at_last": rows_at_last,
+            "updated_at": datetime.now().isoformat()
+        })
+    return summary
+
+
+def _update_summary_llm(previous_summary, new_readings):
+    model = load_model("monitoring")
+    if len(new_readings) > INCREMENTAL_MAX_READINGS:
+        new_readings = downsample_vitals(new_readings, INCREMENTAL_MAX_READINGS)
+    prompt = (
+        "You are a medical assistant. Below is your previous summary of a patient's condition, "
+        "followed by the health logs recorded since then.\n\n"
+        f"Previous summary:\n{previous_summary}\n\n"
+        f"New readings:\n{_format_readings(new_readings)}\n\n"
+        "Update the summary to reflect the new readings. Note any patterns, improvements, or worsening symptoms, "
+        "and revise the guidelines and recommendations only where the new data warrants it."
+    )
+    try:
+        response = model.generate_response(prompt)
+        return response.strip()
+    except Exception as e:
+        return f"⚠️ LLM Error: {e}"
+
+
+def rank_deteriorating_patients(top_n=10, summarize_top=0, now=None):
+    df = read_history()
+    if df is None or df.empty:
+        return pd.DataFrame()
+
+    now = pd.to_datetime(now) if now is not None else df["timestamp"].max()
+    vitals = [col for col in VITAL_THRESHOLDS if col in df.columns]
+    grouped = df.groupby("patient_id")
+    # Hours since each patient's first reading, so slopes are comparable across patients.
+    hours = (df["timestamp"] - grouped["timestamp"].transform("min")).dt.total_seconds() / 3600.0
+
+    ranking = pd.DataFrame({
+        "last_reading": grouped["timestamp"].max(),
+        "readings": grouped.size()
+    })
+    ranking["hours_since_last"] = (now - ranking["last_reading"]).dt.total_seconds() / 3600.0
+    score = pd.Series(0.0, index=ranking.index)
+
+    for vital in vitals:
+        low, high = VITAL_THRESHOLDS[vital]
+        values = pd.to_numeric(df[vital], errors="coerce")
+        # Distance from the middle of the normal band, in half-band units: >1 means out of range.
+        deviation = (values - (low + high) / 2).abs() / ((high - low) / 2)
+        valid = deviation.notna()
+        t, y = hours.where(valid), deviation.where(valid)
+        sums = pd.DataFrame({
+            "n": valid.astype(float), "t": t, "y": y, "ty": t * y, "tt": t * t
+        }).groupby(df["patient_id"]).sum()
+        # Least-squares slope from grouped sums: (n*Σty - Σt*Σy) / (n*Σtt - (Σt)^2).
+        denominator = sums["n"] * sums["tt"] - sums["t"] ** 2
+        slope = (sums["n"] * sums["ty"] - sums["t"] * sums["y"]) / denominator.where(denominator > 0)
+        breaches = ((values < low) | (values > high)).groupby(df["patient_id"]).sum()
+
+        ranking[f"{vital}_slope_per_day"] = (slope * 24).fillna(0.0)
+        ranking[f"{vital}_breaches"] = breaches
+        score += ranking[f"{vital}_slope_per_day"].clip(lower=0) + breaches / ranking["readings"]
+
+    recency_weight = 0.5 ** (ranking["hours_since_last"].clip(lower=0) / RECENCY_HALF_LIFE_HOURS)
+    ranking["deterioration_score"] = score * recency_weight
+    ranking = (
+        ranking.sort_values("deterioration_score", ascending=False)
+        .head(top_n)
+        .reset_index()
+    )
+
+    if summarize_top:
+        top_ids = ranking["patient_id"].head(summarize_top)
+        summaries = {
+            pid: summarize_patient_trends(pid, df[df["patient_id"] == pid].sort_values("timestamp"))
+            for pid in top_ids
+        }
+        ranking["summary"] = ranking["patient_id"].map(summaries)
+    return ranking
+
+
+def generate_monitoring_report(patient_id: str, start=None, end=None) -> str:
+    df = load_patient_history(patient_id, start, end)
+    if df is None:
+        return "❌ No health data available."
     if df.empty:
         return "❌ No entries found for this patient."
-    return summarize_trends_llm(df)
+    if start is None and end is None:
+        return summarize_patient_trends(patient_id, df)
+    return _summarize_window(df)
+
+
+def _safe_name(patient_id):
+    return re.sub(r"[^A-Za-z0-9_.-]", "_", str(patient_id))
+
+
+def _render_chart_file(df, patient_id, chart_path):
+    generate_health_chart(df, patient_id).save(chart_path, format="PNG")
+    return chart_path
+
+
+def _summarize_in_batch(patient_id, df):
+    with priority_scope("batch"):
+        return summarize_patient_trends(patient_id, df)
+
+
+def _write_manifest(manifest_path, manifest):
+    with open(manifest_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(manifest_path + ".tmp", manifest_path)
+
+
+def run_monitoring_batch(output_dir=REPORTS_DIR, chart_workers=BATCH_CHART_WORKERS,
+                         llm_concurrency=BATCH_LLM_CONCURRENCY, charts=True):
+    os.makedirs(output_dir, exist_ok=True)
+    manifest_path = os.path.join(output_dir, "manifest.json")
+    manifest = {"patients": {}, "runs": []}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+
+    df = read_history()
+    if df is None or df.empty:
+        print("[Monitoring] No health data found.")
+        return manifest
+
+    # Resume: a patient checkpointed as ok is skipped only while its data is unchanged, so an
+    # interrupted run picks up where it stopped and the next run still sees new readings.
+    groups = {str(pid): group.sort_values("timestamp") for pid, group in df.groupby("patient_id")}
+    versions = {pid: list(_data_version(group)) for pid, group in groups.items()}
+    done = {pid for pid, entry in manifest["patients"].items()
+            if entry["status"] == "ok" and entry.get("data_version") == versions.get(pid)}
+    pending = [pid for pid in groups if pid not in done]
+    print(f"[Monitoring] {len(pending)} patients to process ({len(done)} already done).")
+
+    started = time.perf_counter()
+    results = {pid: {} for pid in pending}
+    remaining = {pid: 1 + int(charts) for pid in pending}
+    completed = 0
+
+    with ProcessPoolExecutor(max_workers=chart_workers) as chart_pool, \
+            ThreadPoolExecutor(max_workers=llm_concurrency) as llm_pool:
+        futures = {}
+        for pid in pending:
+            base = os.path.join(output_dir, _safe_name(pid))
+            if charts:
+                futures[chart_pool.submit(_render_chart_file, groups[pid], pid, f"{base}_monitoring_chart.png")] = (pid, "chart")
+            futures[llm_pool.submit(_summarize_in_batch, pid, groups[pid])] = (pid, "summary")
+
+        for future in as_completed(futures):
+            pid, kind = futures[future]
+            try:
+                results[pid][kind] = future.result()
+            except Exception as e:
+                results[pid][f"{kind}_error"] = str(e)
+            remaining[pid] -= 1
+            if remaining[pid]:
+                continue
+
+            entry = results.pop(pid)
+            summary = entry.get("summary", "")
+            if summary:
+                summary_path = os.path.join(output_dir, f"{_safe_name(pid)}_summary.txt")
+                with open(summary_path, "w", encoding="utf-8") as f:
+                    f.write(summary)
+                entry["summary"] = summary_path
+            failed = any(key.endswith("_error") for key in entry) or summary.startswith("⚠️")
+            entry["status"] = "error" if failed else "ok"
+            entry["data_version"] = versions[pid]
+            entry["completed_at"] = datetime.now().isoformat()
+            manifest["patients"][pid] = entry
+            _write_manifest(manifest_path, manifest)
+            completed += 1
+
+    elapsed = time.perf_counter() - started
+    throughput = completed / elapsed if elapsed > 0 else 0.0
+    manifest["runs"].append({
+        "finished_at": datetime.now().isoformat(),
+        "patients": completed,
+        "seconds": round(elapsed, 2),
+        "patients_per_second": round(throughput, 3)
+    })
+    _write_manifest(manifest_path, manifest)
+    failures = sum(1 for pid in pending if manifest["patients"][pid]["status"] != "ok")
+    print(f"[Monitoring] Processed {completed} patients in {elapsed:.1f}s "
+          f"({throughput:.2f} patients/s, {failures} failed).")
+    return manifest
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Patient monitoring maintenance jobs")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    compact = commands.add_parser("compact", help="Roll old vitals into hourly/daily aggregates")
+    compact.add_argument("--raw-days", type=float, default=RAW_RETENTION_DAYS)
+    compact.add_argument("--hourly-days", type=float, default=HOURLY_RETENTION_DAYS)
+
+    batch = commands.add_parser("batch", help="Generate summaries and charts for every patient")
+    batch.add_argument("--output-dir", default=REPORTS_DIR)
+    batch.add_argument("--chart-workers", type=int, default=BATCH_CHART_WORKERS)
+    batch.add_argument("--llm-concurrency", type=int, default=BATCH_LLM_CONCURRENCY)
+    batch.add_argument("--no-charts", action="store_true")
+
+    args = parser.parse_args(argv)
+    if args.command == "batch":
+        run_monitoring_batch(args.output_dir, args.chart_workers, args.llm_concurrency, not args.no_charts)
+    elif args.command == "compact":
+        stats = compact_health_history(args.raw_days, args.hourly_days)
+        print(f"[Monitoring] Compacted {stats['compacted']} readings; "
+              f"{stats['raw_rows']} raw rows and {stats['rollup_rows']} rollup rows remain.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,133 @@
+import os
+import sys
 import json
+import time
+import pickle
+import hashlib
+import threading
+import requests
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
 from datetime import datetime
 from typing import Dict, List, Tuple, Optional
 from . import diagnosis_agent, treatment_agent, monitoring_agent, report_agent
+from backend.med_model.scheduler import priority_scope, priority_for_urgency, current_priority
+from backend.med_model import triage_classifier
+from backend.med_model.prompts import PromptTemplate
+from backend.med_model.consultation import Consultation, consultation_scope, current_consultation
+from backend.med_model.resilience import BackendUnavailable, deadline_scope, current_deadline, time_remaining
+from backend.utils import keyword_matcher
+from backend.utils.red_flags import assess_red_flags
+from backend.utils.pharmacology import precheck_treatment_safety
 from .specialist_agents import (
     CardiologyAgent, NeurologyAgent, PharmacologyAgent,
     PsychiatryAgent, PulmonologyAgent, GastroenterologyAgent,
-    DermatologyAgent, EndocrinologyAgent
+    DermatologyAgent, EndocrinologyAgent, EmergencyAgent
 )
 
+CONTEXT_HISTORY_LIMIT = 50
+SESSION_MEMORY_CAP_BYTES = 64 * 1024 * 1024
+SESSION_IDLE_SECONDS = 30 * 60
+SESSION_SPILL_DIR = "backend/patient_data/sessions/"
+DEFAULT_SESSION = "default"
+SPECIALIST_DEADLINE_SECONDS = 120
+# End-to-end budget for one diagnosis workflow. Optional stages are skipped or shortened
+# when what is left would not cover them plus the time reserved for treatment planning.
+WORKFLOW_DEADLINE_SECONDS = 180
+TREATMENT_RESERVE_SECONDS = 45
+SPECIALIST_MIN_SECONDS = 20
+SAFETY_MIN_SECONDS = 10
+SAFETY_WORKERS = 4
+# How one consultation's steps share state with Ollama: "context", "prefix" or "off".
+CONSULTATION_CONTEXT_MODE = "context"
+
+TREATMENT_TIMEOUT_MESSAGE = "⚠️ Treatment planning could not finish in time. Please try again or consult a clinician."
+TREATMENT_UNAVAILABLE_MESSAGE = "⚠️ The treatment planning service is temporarily unavailable. Please try again in a minute."
+TREATMENT_ERROR_MESSAGE = "⚠️ Sorry, there was an error generating the treatment plan."
+SAFETY_SKIPPED_NOTE = "ℹ️ Automated safety check skipped (time limit reached); review this plan with a clinician or pharmacist."
+FOLLOW_UP_RECOMMENDATIONS = [
+    "Consider follow-up in 24-48 hours",
+    "Monitor for symptom changes",
+    "Seek immediate care if symptoms worsen"
+]
+
+FAST_CONSULTATION_SCHEMA = {
+    "type": "object",
+    "required": ["relevant", "diagnosis", "specialist", "treatment", "safety"],
+    "properties": {
+        "relevant": {"type": "boolean"},
+        "diagnosis": {"type": "string"},
+        "specialist": {
+            "type": "string",
+            "enum": ["general", "cardiology", "neurology", "pharmacology", "psychiatry", "pulmonology",
+                     "gastroenterology", "dermatology", "endocrinology"]
+        },
+        "treatment": {"type": "string"},
+        "safety": {
+            "type": "object",
+            "required": ["safe", "warning", "risk_level"],
+            "properties": {
+                "safe": {"type": "boolean"},
+                "warning": {"type": "string"},
+                "risk_level": {"type": "string", "enum": ["low", "medium", "high", "critical"]}
+            }
+        }
+    }
+}
+
+# Replies from the streaming JSON agents are checked against these before use.
+INTENT_SCHEMA = {
+    "type": "object",
+    "required": ["intent", "urgency"],
+    "properties": {
+        "intent": {"type": "string"},
+        "urgency": {"type": "string"},
+        "specialists": {"type": "array", "items": {"type": "string"}},
+        "data_needed": {"type": "array", "items": {"type": "string"}},
+        "workflow_steps": {"type": "array", "items": {"type": "string"}}
+    }
+}
+
+SAFETY_SCHEMA = {
+    "type": "object",
+    "required": ["safe"],
+    "properties": {
+        "safe": {"type": "boolean"},
+        "warning": {"type": "string"},
+        "risk_level": {"type": "string", "enum": ["low", "medium", "high", "critical"]}
+    }
+}
+
+# Structured intent used when the local classifier is confident enough to skip the LLM.
+INTENT_PROFILES = {
+    "diagnosis": ("medium", ["symptoms"], ["validate_input", "diagnose", "recommend_treatment"]),
+    "treatment": ("medium", ["symptoms", "medications"], ["validate_input", "diagnose", "recommend_treatment"]),
+    "monitoring": ("low", ["vitals", "history"], ["load_history", "summarize_trends"]),
+    "reporting": ("low", ["history"], ["collect_results", "write_report"]),
+    "emergency": ("emergency", ["symptoms"], ["triage", "diagnose", "recommend_treatment"]),
+    "general": ("low", ["symptoms"], ["validate_input", "diagnose"])
+}
+
+
+class Interaction:
+    __slots__ = ("timestamp", "type", "content", "agent")
+
+    def __init__(self, interaction_type: str, content: str, agent: str):
+        self.timestamp = datetime.now().isoformat()
+        self.type = interaction_type
+        self.content = content
+        self.agent = agent
+
+
 class PatientContext:
-    def __init__(self):
-        self.conversation_history = []
+    __slots__ = (
+        "conversation_history", "patient_profile", "current_symptoms",
+        "current_diagnosis", "current_treatment", "specialist_consultations"
+    )
+
+    def __init__(self, max_history: int = CONTEXT_HISTORY_LIMIT):
+        # Ring buffer: only the most recent interactions are kept per session.
+        self.conversation_history = deque(maxlen=max_history)
         self.patient_profile = {}
         self.current_symptoms = ""
         self.current_diagnosis = ""
@@ -18,12 +135,15 @@ class PatientContext:
         self.specialist_consultations = {}
 
     def add_interaction(self, interaction_type: str, content: str, agent: str):
-        self.conversation_history.append({
-            "timestamp": datetime.now().isoformat(),
-            "type": interaction_type,
-            "content": content,
-            "agent": agent
-        })
+        self.conversation_history.append(Interaction(interaction_type, content, agent))
+
+    def approx_bytes(self) -> int:
+        size = sys.getsizeof(self.current_symptoms) + sys.getsizeof(self.current_diagnosis) + sys.getsizeof(self.current_treatment)
+        size += sum(sys.getsizeof(item.content) + sys.getsizeof(item.timestamp) for item in self.conversation_history)
+        size += sys.getsizeof(self.conversation_history) + len(self.conversation_history) * sys.getsizeof(Interaction("", "", ""))
+        size += sum(sys.getsizeof(str(value)) for value in self.patient_profile.values())
+        size += sum(sys.getsizeof(str(value)) for value in self.specialist_consultations.values())
+        return size
 
     def get_context_summary(self) -> str:
         return f"""
@@ -35,10 +155,236 @@ class PatientContext:
             """
 
 
+class SessionStore:
+    def __init__(self, max_bytes: int = SESSION_MEMORY_CAP_BYTES, idle_seconds: float = SESSION_IDLE_SECONDS,
+                 spill_dir: str = SESSION_SPILL_DIR):
+        self.max_bytes = max_bytes
+        self.idle_seconds = idle_seconds
+        self.spill_dir = spill_dir
+        self._live = OrderedDict()  # session_id -> (context, size, last_used), least recently used first
+        self._live_bytes = 0
+        self._lock = threading.RLock()
+
+    def _spill_path(self, session_id: str) -> str:
+        return os.path.join(self.spill_dir, hashlib.sha1(session_id.encode("utf-8")).hexdigest() + ".pkl")
+
+    def get(self, session_id: str) -> PatientContext:
+        with self._lock:
+            if session_id in self._live:
+                context, size, _ = self._live.pop(session_id)
+            else:
+                # New and restored contexts count toward the cap from the start, not only
+                # once update() is called for them.
+                context = self._restore(session_id)
+                size = context.approx_bytes()
+                self._live_bytes += size
+            self._live[session_id] = (context, size, time.monotonic())
+            self._evict(keep=session_id)
+            return context
+
+    def update(self, session_id: str):
+        with self._lock:
+            if session_id not in self._live:
+                return
+            context, size, _ = self._live.pop(session_id)
+            new_size = context.approx_bytes()
+            self._live_bytes += new_size - size
+            self._live[session_id] = (context, new_size, time.monotonic())
+            self._evict(keep=session_id)
+
+    def _restore(self, session_id: str) -> PatientContext:
+        path = self._spill_path(session_id)
+        if not os.path.exists(path):
+            return PatientContext()
+        with open(path, "rb") as f:
+            context = pickle.load(f)
+        os.remove(path)
+        return context
+
+    def _spill(self, session_id: str, context: PatientContext):
+        os.makedirs(self.spill_dir, exist_ok=True)
+        with open(self._spill_path(session_id), "wb") as f:
+            pickle.dump(context, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def _evict(self, keep: Optional[str] = None):
+        now = time.monotonic()
+        for session_id in list(self._live):
+            if session_id == keep:
+                continue
+            context, size, last_used = self._live[session_id]
+            over_cap = self._live_bytes > self.max_bytes
+            if not over_cap and now - last_used < self.idle_seconds:
+                break  # everything after this entry was used more recently
+            del self._live[session_id]
+            self._live_bytes -= size
+            self._spill(session_id, context)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            self._evict()
+            spilled = len(os.listdir(self.spill_dir)) if os.path.isdir(self.spill_dir) else 0
+            return {
+                "live_contexts": len(self._live),
+                "live_bytes": self._live_bytes,
+                "spilled_contexts": spilled
+            }
+
+
+class WorkflowStep:
+    __slots__ = ("name", "fn", "requires", "after", "gate", "side_branch")
+
+    def __init__(self, name: str, fn, requires: Tuple[str, ...] = (), gate: bool = False,
+                 side_branch: bool = False, after: Tuple[str, ...] = ()):
+        self.name = name
+        self.fn = fn
+        self.requires = tuple(requires)
+        # Soft dependencies: waited for and their results used if present, but a failed or
+        # skipped one does not skip this step.
+        self.after = tuple(after)
+        # A gate step returning False skips everything that depends on it.
+        self.gate = gate
+        # Side branches read the consultation's carried context but must not advance it.
+        self.side_branch = side_branch
+
+
+class WorkflowDAG:
+    def __init__(self, steps: List[WorkflowStep]):
+        self.steps = {step.name: step for step in steps}
+        for step in steps:
+            unknown = [name for name in step.requires + step.after if name not in self.steps]
+            if unknown:
+                raise ValueError(f"Step {step.name} requires unknown steps: {unknown}")
+
+    def subgraph(self, targets: List[str]) -> List[str]:
+        # The targets plus everything they transitively require, in a dependency-respecting order.
+        order, seen = [], set()
+
+        def visit(name):
+            if name in seen:
+                return
+            seen.add(name)
+            for dependency in self.steps[name].requires + self.steps[name].after:
+                visit(dependency)
+            order.append(name)
+
+        for target in targets:
+            if target in self.steps:
+                visit(target)
+        return order
+
+    def run(self, targets: List[str], state: Dict, max_workers: int = 4) -> Tuple[Dict, List[Dict]]:
+        # Steps start as soon as their requirements finish; independent ones run side by side.
+        # Each step gets the shared `state` and the results so far, and runs with the caller's
+        # priority, consultation and deadline.
+        names = self.subgraph(targets)
+        results, trace = {}, []
+        status = {}
+        priority, consultation, workflow_deadline = current_priority(), current_consultation(), current_deadline()
+        started = time.perf_counter()
+
+        def execute(step):
+            branch = consultation.fork() if consultation is not None and step.side_branch else consultation
+            step_started = time.perf_counter()
+            with priority_scope(priority), consultation_scope(branch), deadline_scope(workflow_deadline):
+                try:
+                    return step.fn(state, results), step_started, None
+                except Exception as e:
+                    return None, step_started, e
+
+        def record(name, step_status, step_started=None, error=None):
+            status[name] = step_status
+            entry = {"step": name, "status": step_status, "requires": list(self.steps[name].requires),
+                     "after": list(self.steps[name].after)}
+            if step_started is not None:
+                entry["start_ms"] = round(1000 * (step_started - started), 1)
+                entry["duration_ms"] = round(1000 * (time.perf_counter() - step_started), 1)
+            if error is not None:
+                entry["error"] = str(error)
+            trace.append(entry)
+
+        pending = list(names)
+        running = {}
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            while pending or running:
+                for name in list(pending):
+                    step = self.steps[name]
+                    if any(status.get(dependency) in ("skipped", "error", "gate_closed") for dependency in step.requires):
+                        pending.remove(name)
+                        record(name, "skipped")
+                    elif all(status.get(dependency) == "ok" for dependency in step.requires) and \
+                            all(dependency in status for dependency in step.after):
+                        pending.remove(name)
+                        running[executor.submit(execute, step)] = name
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    value, step_started, error = future.result()
+                    if error is not None:
+                        print(f"[Orchestrator] Workflow step {name} failed: {error}")
+                        record(name, "error", step_started, error)
+                        continue
+                    results[name] = value
+                    record(name, "gate_closed" if self.steps[name].gate and not value else "ok", step_started)
+        return results, trace
+
+
 class MedicalOrchestrator:
+    INTENT_PROMPT = PromptTemplate("orchestrator.intent", """
+            You are a medical AI coordinator. Analyze the following user input and determine:
+            1. Primary intent (diagnosis, treatment, monitoring, reporting, emergency)
+            2. Urgency level (low, medium, high, emergency)
+            3. Required specialist consultation (general, cardiology, neurology, pharmacology, etc.)
+            4. Patient data needed (symptoms, history, vitals, medications)
+            User Input: "{user_input}"
+            Respond in JSON format:
+            {{
+                "intent": "diagnosis|treatment|monitoring|reporting|emergency",
+                "urgency": "low|medium|high|emergency",
+                "specialists": ["general", "cardiology", "neurology", "pharmacology"],
+                "data_needed": ["symptoms", "history", "vitals", "medications"],
+                "workflow_steps": ["step1", "step2", "step3"]
+            }}
+""", task="intent", truncatable=('user_input',))
+
+    SAFETY_PROMPT = PromptTemplate("orchestrator.safety", """
+                You are a medical safety validator. Analyze this treatment plan for potential safety concerns:
+                Symptoms: {symptoms}
+                Diagnosis: {diagnosis}
+                Treatment: {treatment}
+                Check for:
+                1. Dangerous drug interactions
+                2. Contraindications
+                3. Dosing errors
+                4. Missing critical warnings
+                5. Emergency symptoms that need immediate care
+
+                Respond with JSON:
+                {{
+                    "safe": true/false,
+                    "warning": "description if unsafe",
+                    "risk_level": "low|medium|high|critical"
+                }}
+""", task="safety", truncatable=('diagnosis', 'treatment', 'symptoms'))
+
+    FAST_CONSULTATION_PROMPT = PromptTemplate("orchestrator.fast_consultation", """
+You are an expert medical assistant handling a complete consultation in one step.
+Patient input: "{symptoms}"
+
+Return a single JSON object with:
+- "relevant": false if the input is not about a symptom, health issue, diagnosis, treatment or medical concern
+- "diagnosis": a detailed possible diagnosis in a human-friendly paragraph (empty if not relevant)
+- "specialist": the most appropriate specialty to involve, or "general"
+- "treatment": a formatted treatment plan with Primary Medication (drug, dose, frequency), Duration and
+  Instructions, Non-Pharmacological Advice, Recommended Tests (if any) and Follow-Up. No citations or confidence scores.
+- "safety": your own review of that plan for drug interactions, contraindications, dosing errors, missing
+  warnings and emergency symptoms, as {{"safe": true/false, "warning": "...", "risk_level": "low|medium|high|critical"}}
+""", task="diagnosis", truncatable=("symptoms",))
+
     def __init__(self, model):
         self.model = model
-        self.context = PatientContext()
+        self.sessions = SessionStore()
         self.available_agents = {
             "diagnosis": diagnosis_agent,
             "treatment": treatment_agent,
@@ -55,33 +401,37 @@ class MedicalOrchestrator:
             "dermatology": DermatologyAgent(model),
             "endocrinology": EndocrinologyAgent(model)
         }
+        self.emergency_agent = EmergencyAgent(model)
+        self._safety_executor = ThreadPoolExecutor(max_workers=SAFETY_WORKERS, thread_name_prefix="safety")
+        self.workflow = self._build_workflow()
+
+    @property
+    def context(self) -> PatientContext:
+        return self.sessions.get(DEFAULT_SESSION)
+
+    def session_stats(self) -> Dict[str, int]:
+        return self.sessions.stats()
 
     def analyze_query_intent(self, user_input: str) -> Dict[str, any]:
-        prompt = f"""
-            You are a medical AI coordinator. Analyze the following user input and determine:
-            1. Primary intent (diagnosis, treatment, monitoring, reporting, emergency)
-            2. Urgency level (low, medium, high, emergency)
-            3. Required specialist consultation (general, cardiology, neurology, pharmacology, etc.)
-            4. Patient data needed (symptoms, history, vitals, medications)
-            User Input: "{user_input}"
-            Respond in JSON format:
-            {{
-                "intent": "diagnosis|treatment|monitoring|reporting|emergency",
-                "urgency": "low|medium|high|emergency", 
-                "specialists": ["general", "cardiology", "neurology", "pharmacology"],
-                "data_needed": ["symptoms", "history", "vitals", "medications"],
-                "workflow_steps": ["step1", "step2", "step3"]
-            }}
-            """
-            
+        intent = triage_classifier.predict_intent(user_input)
+        if intent is not None:
+            urgency, data_needed, workflow_steps = INTENT_PROFILES[intent]
+            specialist = self.determine_specialist_consultation(user_input, "")
+            return {
+                "intent": intent,
+                "urgency": urgency,
+                "specialists": [specialist or "general"],
+                "data_needed": list(data_needed),
+                "workflow_steps": list(workflow_steps)
+            }
+        return self.analyze_query_intent_llm(user_input)
+
+    def analyze_query_intent_llm(self, user_input: str) -> Dict[str, any]:
+        prompt = self.INTENT_PROMPT.render(user_input=user_input)
         try:
-            response = self.model.generate_response(prompt)
-            json_start = response.find('{')
-            json_end = response.rfind('}') + 1
-            if json_start != -1 and json_end != -1:
-                return json.loads(response[json_start:json_end])
-        except:
-            pass
+            return self.model.generate_json(prompt, INTENT_SCHEMA, profile="intent")
+        except (ValueError, requests.RequestException) as e:
+            print(f"[Orchestrator] Intent analysis failed, using keyword fallback: {e}")
         user_lower = user_input.lower()
         if any(word in user_lower for word in ['pain', 'hurt', 'ache', 'symptom']):
             return {
@@ -101,105 +451,420 @@ class MedicalOrchestrator:
 
 
 
-    def coordinate_diagnosis_workflow(self, symptoms: str) -> Tuple[str, str, Dict]:
+    def coordinate_diagnosis_workflow(self, symptoms: str, session_id: str = DEFAULT_SESSION,
+                                      urgency: Optional[str] = None, max_specialists: int = 1,
+                                      specialist_deadline: float = SPECIALIST_DEADLINE_SECONDS,
+                                      context_mode: str = CONSULTATION_CONTEXT_MODE,
+                                      deadline: Optional[float] = WORKFLOW_DEADLINE_SECONDS,
+                                      defer_safety: bool = False) -> Tuple[str, str, Dict]:
+        # The diagnosis -> specialists -> treatment -> safety subset of the workflow DAG.
+        # Urgency from analyze_query_intent or EmergencyAgent.triage_urgency moves every
+        # LLM call of this consultation ahead in the scheduler queue; `deadline` caps them all.
+        # A red-flag match (checked before any model call) counts as an emergency.
+        red_flags = assess_red_flags(symptoms)
+        if red_flags is not None and urgency is None:
+            urgency = "emergency"
+        workflow_log = _new_workflow_log()
+        state = {"text": symptoms, "session_id": session_id, "patient_id": None, "patient": {}, "log": workflow_log,
+                 "max_specialists": max_specialists, "specialist_deadline": specialist_deadline,
+                 "defer_safety": defer_safety}
+        results = self._run_workflow(["recommend_treatment", "validate_safety"], state, urgency, context_mode, deadline)
+        outputs = self._workflow_outputs(state, results)
+        workflow_log["red_flags"] = red_flags
+        if "recommend_treatment" in results:
+            workflow_log["recommendations"] = list(FOLLOW_UP_RECOMMENDATIONS)
+        diagnosis = outputs.get("diagnosis", "⚠️ Sorry, the consultation could not be completed. Please try again.")
+        return diagnosis, outputs.get("treatment", ""), workflow_log
+
+    def consult_specialists(self, symptoms: str, specialties: List[str],
+                            deadline: float = SPECIALIST_DEADLINE_SECONDS) -> List[Tuple[str, str]]:
+        # Consultations run side by side under one shared deadline; results keep the ranked order.
+        priority = current_priority()
+        consultation = current_consultation()
+        # The per-specialist deadline reaches the model calls themselves, so a straggler that
+        # is abandoned below also stops (and frees its scheduler slot) instead of running on.
+        expires = time.monotonic() + deadline
+        workflow_deadline = current_deadline()
+        if workflow_deadline is not None:
+            expires = min(expires, workflow_deadline)
+
+        def consult(specialty):
+            branch = consultation.fork() if consultation is not None else None
+            with priority_scope(priority), consultation_scope(branch), deadline_scope(expires):
+                return self.specialist_agents[specialty].consult(symptoms)
+
+        executor = ThreadPoolExecutor(max_workers=max(1, len(specialties)))
+        futures = {specialty: executor.submit(consult, specialty) for specialty in specialties}
+        wait(futures.values(), timeout=deadline)
+        # Don't hold the workflow hostage to a straggler; it finishes (and is discarded) in the background.
+        executor.shutdown(wait=False, cancel_futures=True)
+
+        opinions = []
+        for specialty, future in futures.items():
+            if not future.done() or future.cancelled():
+                continue
+            try:
+                opinions.append((specialty, future.result()))
+            except Exception as e:
+                print(f"[Orchestrator] {specialty} consultation failed: {e}")
+        return opinions
+
+    def coordinate_fast_workflow(self, symptoms: str, session_id: str = DEFAULT_SESSION,
+                                 urgency: Optional[str] = None) -> Tuple[str, str, Dict]:
+        # One schema-constrained call replaces relevance, diagnosis, specialist, treatment and safety.
         workflow_log = {
-            "steps": [],
-            "agents_consulted": [],
+            "steps": ["Fast Consultation"],
+            "agents_consulted": ["orchestrator"],
             "confidence_scores": {},
             "recommendations": []
         }
+        prompt = self.FAST_CONSULTATION_PROMPT.render(symptoms=symptoms)
+        try:
+            with priority_scope(priority_for_urgency(urgency)):
+                result = self.model.generate_structured(prompt, FAST_CONSULTATION_SCHEMA, profile="fast_consultation")
+        except Exception as e:
+            print(f"[Orchestrator] Fast consultation failed, using standard workflow: {e}")
+            diagnosis, treatment, standard_log = self.coordinate_diagnosis_workflow(symptoms, session_id, urgency)
+            standard_log["steps"].insert(0, "Fast Consultation (failed)")
+            return diagnosis, treatment, standard_log
 
-        workflow_log["steps"].append("Initial Triage")
-        if not diagnosis_agent.is_input_medical(symptoms, self.model):
+        if not result["relevant"]:
             return "❌ Input not medically relevant", "", workflow_log
 
-        workflow_log["steps"].append("Primary Diagnosis")
-        workflow_log["agents_consulted"].append("diagnosis_agent")
+        diagnosis = result["diagnosis"].strip()
+        treatment_plan = treatment_agent.clean_model_output(result["treatment"])
+        if result["specialist"] != "general":
+            workflow_log["agents_consulted"].append(result["specialist"])
+        safety = result["safety"]
+        treatment_plan = apply_safety_verdict(treatment_plan, safety)
+        workflow_log["confidence_scores"]["risk_level"] = safety["risk_level"]
 
-        primary_diagnosis = diagnosis_agent.generate_diagnosis(symptoms)
-        self.context.current_symptoms = symptoms
-        self.context.current_diagnosis = primary_diagnosis
+        context = self.sessions.get(session_id)
+        context.current_symptoms = symptoms
+        context.current_diagnosis = diagnosis
+        context.current_treatment = treatment_plan
+        context.add_interaction("diagnosis", diagnosis, "orchestrator")
+        context.add_interaction("treatment", treatment_plan, "orchestrator")
+        self.sessions.update(session_id)
 
-        specialist = self.determine_specialist_consultation(symptoms, primary_diagnosis)
-        if specialist and specialist in self.specialist_agents:
-            workflow_log["steps"].append(f"Specialist Consultation: {specialist}")
-            workflow_log["agents_consulted"].append(specialist)
-            specialist_diagnosis = self.specialist_agents[specialist].model.generate_response(symptoms)
-            primary_diagnosis = f"{primary_diagnosis}\n\n**Specialist Opinion ({specialist}):**\n{specialist_diagnosis}"
+        workflow_log["recommendations"] = list(FOLLOW_UP_RECOMMENDATIONS)
+        return diagnosis, treatment_plan, workflow_log
 
-        workflow_log["steps"].append("Treatment Planning")
-        workflow_log["agents_consulted"].append("treatment_agent")
+    def _build_workflow(self) -> WorkflowDAG:
+        # Step names match the `workflow_steps` vocabulary of analyze_query_intent.
+        return WorkflowDAG([
+            WorkflowStep("validate_input", self._step_validate_input, gate=True),
+            WorkflowStep("triage", self._step_triage, side_branch=True),
+            WorkflowStep("diagnose", self._step_diagnose, requires=("validate_input",)),
+            WorkflowStep("consult_specialists", self._step_specialists, requires=("validate_input",), side_branch=True),
+            WorkflowStep("recommend_treatment", self._step_treatment, requires=("diagnose",),
+                         after=("consult_specialists",)),
+            WorkflowStep("validate_safety", self._step_safety, requires=("recommend_treatment",)),
+            WorkflowStep("load_history", self._step_load_history),
+            WorkflowStep("summarize_trends", self._step_summarize_trends, requires=("load_history",)),
+            WorkflowStep("collect_results", self._step_collect_results),
+            WorkflowStep("write_report", self._step_write_report, requires=("collect_results",))
+        ])
 
-        treatment_plan = treatment_agent.generate_treatment(symptoms, primary_diagnosis, self.model)
-        self.context.current_treatment = treatment_plan
+    def workflow_targets(self, intent: Dict[str, any]) -> List[str]:
+        targets = [step for step in intent.get("workflow_steps", []) if step in self.workflow.steps]
+        if not targets:
+            targets = list(INTENT_PROFILES.get(intent.get("intent"), INTENT_PROFILES["general"])[2])
+        if "recommend_treatment" in targets and "validate_safety" not in targets:
+            targets.append("validate_safety")
+        return targets
 
-        workflow_log["steps"].append("Safety Validation")
-        safety_check = self.validate_treatment_safety(symptoms, primary_diagnosis, treatment_plan)
-        if not safety_check["safe"]:
-            treatment_plan = f"⚠️ **SAFETY ALERT**: {safety_check['warning']}\n\n{treatment_plan}"
+    def coordinate_intent_workflow(self, user_input: str, session_id: str = DEFAULT_SESSION,
+                                   patient_id: Optional[str] = None, patient: Optional[Dict[str, str]] = None,
+                                   deadline: Optional[float] = WORKFLOW_DEADLINE_SECONDS,
+                                   defer_safety: bool = False) -> Tuple[Dict[str, any], Dict]:
+        # The intent picks which steps run: a monitoring question never pays for diagnosis and treatment.
+        red_flags = assess_red_flags(user_input)
+        intent = self.analyze_query_intent(user_input)
+        workflow_log = _new_workflow_log()
+        workflow_log["intent"] = intent.get("intent")
+        state = {"text": user_input, "session_id": session_id, "patient_id": patient_id,
+                 "patient": patient or {}, "log": workflow_log, "defer_safety": defer_safety}
+        urgency = "emergency" if red_flags is not None else intent.get("urgency")
+        results = self._run_workflow(self.workflow_targets(intent), state, urgency, CONSULTATION_CONTEXT_MODE, deadline)
+        outputs = self._workflow_outputs(state, results)
+        workflow_log["red_flags"] = red_flags
+        if "recommend_treatment" in results:
+            workflow_log["recommendations"] = list(FOLLOW_UP_RECOMMENDATIONS)
+        return outputs, workflow_log
 
-        self.context.add_interaction("diagnosis", primary_diagnosis, "diagnosis_agent")
-        self.context.add_interaction("treatment", treatment_plan, "treatment_agent")
+    def _run_workflow(self, targets: List[str], state: Dict, urgency: Optional[str], context_mode: str,
+                      deadline: Optional[float]) -> Dict:
+        consultation = Consultation(state["text"], context_mode)
+        started = time.monotonic()
+        expires = started + deadline if deadline else None
+        with priority_scope(priority_for_urgency(urgency)), consultation_scope(consultation), deadline_scope(expires):
+            results, trace = self.workflow.run(targets, state)
+        state["log"]["trace"] = trace
+        state["log"]["consultation"] = consultation.summary()
+        state["log"]["elapsed_seconds"] = time.monotonic() - started
+        return results
 
-        workflow_log["recommendations"] = [
-            "Consider follow-up in 24-48 hours",
-            "Monitor for symptom changes", 
-            "Seek immediate care if symptoms worsen"
-        ]
+    def _workflow_outputs(self, state: Dict, results: Dict) -> Dict[str, any]:
+        user_input, session_id = state["text"], state["session_id"]
+        outputs = {}
+        if results.get("validate_input") is False:
+            outputs["diagnosis"] = "❌ Input not medically relevant"
+        context = self.sessions.get(session_id)
+        if "diagnose" in results:
+            outputs["diagnosis"] = _with_opinions(results["diagnose"], results.get("consult_specialists", []))
+            context.current_symptoms = user_input
+            context.current_diagnosis = outputs["diagnosis"]
+            context.add_interaction("diagnosis", outputs["diagnosis"], "diagnosis_agent")
+        treatment_status = next((entry["status"] for entry in state["log"].get("trace", [])
+                                 if entry["step"] == "recommend_treatment"), None)
+        if treatment_status in ("error", "skipped") and results.get("validate_input") is not False:
+            # Planning was asked for but did not run; say so rather than leave it blank.
+            outputs["treatment"] = TREATMENT_ERROR_MESSAGE
+        if "recommend_treatment" in results:
+            treatment_plan = results["recommend_treatment"]
+            safety_check = results.get("validate_safety")
+            if treatment_plan is None:
+                treatment_plan = state.get("treatment_failure", TREATMENT_ERROR_MESSAGE)
+            elif safety_check and safety_check.get("skipped"):
+                treatment_plan = f"{SAFETY_SKIPPED_NOTE}\n\n{treatment_plan}"
+            elif safety_check:
+                treatment_plan = apply_safety_verdict(treatment_plan, safety_check)
+            outputs["treatment"] = treatment_plan
+            context.current_treatment = treatment_plan
+            context.add_interaction("treatment", treatment_plan, "treatment_agent")
+        if "triage" in results:
+            outputs["triage"] = results["triage"]
+        if "summarize_trends" in results:
+            outputs["monitoring_summary"] = results["summarize_trends"]
+            context.add_interaction("monitoring", results["summarize_trends"], "monitoring_agent")
+        if "write_report" in results:
+            outputs["report"] = results["write_report"]
+        self.sessions.update(session_id)
+        return outputs
 
-        return primary_diagnosis, treatment_plan, workflow_log
+    def _step_validate_input(self, state: Dict, results: Dict) -> bool:
+        state["log"]["steps"].append("Initial Triage")
+        return diagnosis_agent.is_input_medical(state["text"], self.model)
 
-    def coordinate_monitoring_workflow(self, patient_id: str) -> Tuple[str, Optional[str]]:
-        summary, chart_path = monitoring_agent.analyze_patient_history(patient_id)
-        self.context.add_interaction("monitoring", summary, "monitoring_agent")
-        return summary, chart_path
+    def _step_triage(self, state: Dict, results: Dict) -> Dict:
+        state["log"]["steps"].append("Emergency Triage")
+        state["log"]["agents_consulted"].append("emergency")
+        return self.emergency_agent.triage_urgency(state["text"])
 
-    def determine_specialist_consultation(self, symptoms: str, diagnosis: str) -> Optional[str]:
-        specialist_keywords = {
-            "cardiology": ["chest", "heart", "palpitations"],
-            "neurology": ["headache", "seizure", "numbness", "dizziness"],
-            "pharmacology": ["drug", "medication", "dose", "interaction"],
-            "psychiatry": ["depression", "mood", "anxiety", "suicidal", "sleep"],
-            "pulmonology": ["cough", "asthma", "breath", "wheezing"],
-            "gastroenterology": ["stomach", "nausea", "vomit", "digestion"],
-            "dermatology": ["rash", "skin", "itch"],
-            "endocrinology": ["diabetes", "thyroid", "hormone"]
-        }
-        lower_symptoms = symptoms.lower()
-        for specialty, keywords in specialist_keywords.items():
-            if any(kw in lower_symptoms for kw in keywords):
-                return specialty
+    def _step_diagnose(self, state: Dict, results: Dict) -> str:
+        state["log"]["steps"].append("Primary Diagnosis")
+        state["log"]["agents_consulted"].append("diagnosis_agent")
+        return diagnosis_agent.generate_diagnosis(state["text"])
+
+    def _step_specialists(self, state: Dict, results: Dict) -> List[Tuple[str, str]]:
+        # Routing only needs the symptoms, so specialists run alongside the primary diagnosis.
+        log = state["log"]
+        ranked = self.rank_specialist_consultations(state["text"], "")[:state.get("max_specialists", 1)]
+        if not ranked:
+            return []
+        log["confidence_scores"]["specialist_routing"] = dict(ranked)
+        specialist_deadline = state.get("specialist_deadline", SPECIALIST_DEADLINE_SECONDS)
+        budget = min(specialist_deadline, _remaining() - TREATMENT_RESERVE_SECONDS)
+        if budget < SPECIALIST_MIN_SECONDS:
+            _degrade(log, "specialist_consultation", "skipped: not enough time left before treatment planning")
+            return []
+        if budget < specialist_deadline:
+            _degrade(log, "specialist_consultation", f"deadline shortened to {budget:.0f}s")
+        opinions = self.consult_specialists(state["text"], [specialty for specialty, _ in ranked], budget)
+        context = self.sessions.get(state["session_id"])
+        for specialist, specialist_diagnosis in opinions:
+            log["steps"].append(f"Specialist Consultation: {specialist}")
+            log["agents_consulted"].append(specialist)
+            context.specialist_consultations[specialist] = specialist_diagnosis
+        missed = [specialty for specialty, _ in ranked if specialty not in dict(opinions)]
+        if missed:
+            log["steps"].append(f"Specialist Consultation timed out: {', '.join(missed)}")
+        return opinions
+
+    def _step_treatment(self, state: Dict, results: Dict) -> Optional[str]:
+        # None means no plan was produced (state["treatment_failure"] says why to the user);
+        # there is then nothing to validate.
+        state["log"]["steps"].append("Treatment Planning")
+        state["log"]["agents_consulted"].append("treatment_agent")
+        diagnosis = _with_opinions(results["diagnose"], results.get("consult_specialists", []))
+        try:
+            return treatment_agent.generate_treatment(state["text"], diagnosis, self.model)
+        except requests.Timeout as e:
+            _degrade(state["log"], "treatment_planning", f"timed out: {e}")
+            state["treatment_failure"] = TREATMENT_TIMEOUT_MESSAGE
+        except BackendUnavailable as e:
+            _degrade(state["log"], "treatment_planning", f"backend unavailable: {e}")
+            state["treatment_failure"] = TREATMENT_UNAVAILABLE_MESSAGE
+        except requests.RequestException as e:
+            _degrade(state["log"], "treatment_planning", f"failed: {e}")
+            state["treatment_failure"] = TREATMENT_ERROR_MESSAGE
         return None
 
+    def _step_safety(self, state: Dict, results: Dict) -> Optional[Dict[str, any]]:
+        treatment_plan = results["recommend_treatment"]
+        if treatment_plan is None:
+            return None
+        diagnosis = _with_opinions(results["diagnose"], results.get("consult_specialists", []))
+        if state.get("defer_safety"):
+            # Off the critical path: the caller shows the plan now and applies the verdict
+            # from resolve_deferred_safety() when it arrives.
+            state["log"]["steps"].append("Safety Validation (deferred)")
+            state["log"]["safety_pending"] = self.validate_treatment_safety_async(state["text"], diagnosis, treatment_plan)
+            return None
+        if _remaining() < SAFETY_MIN_SECONDS:
+            _degrade(state["log"], "safety_validation", "skipped: time budget exhausted")
+            return {"skipped": True}
+        state["log"]["steps"].append("Safety Validation")
+        return self.validate_treatment_safety(state["text"], diagnosis, treatment_plan)
 
+    def _step_load_history(self, state: Dict, results: Dict):
+        state["log"]["steps"].append("Load History")
+        return monitoring_agent.load_patient_history(state["patient_id"]) if state["patient_id"] else None
 
-    def validate_treatment_safety(self, symptoms: str, diagnosis: str, treatment: str) -> Dict[str, any]:
-        prompt = f"""
-                You are a medical safety validator. Analyze this treatment plan for potential safety concerns:
-                Symptoms: {symptoms}
-                Diagnosis: {diagnosis}  
-                Treatment: {treatment}
-                Check for:
-                1. Dangerous drug interactions
-                2. Contraindications
-                3. Dosing errors
-                4. Missing critical warnings
-                5. Emergency symptoms that need immediate care
+    def _step_summarize_trends(self, state: Dict, results: Dict) -> str:
+        df = results["load_history"]
+        if df is None or df.empty:
+            return "No health data found for this patient."
+        state["log"]["steps"].append("Trend Summary")
+        state["log"]["agents_consulted"].append("monitoring_agent")
+        return monitoring_agent.summarize_patient_trends(state["patient_id"], df)
 
-                Respond with JSON:
-                {{
-                    "safe": true/false,
-                    "warning": "description if unsafe",
-                    "risk_level": "low|medium|high|critical"
-                }}
-                """
-                
+    def _step_collect_results(self, state: Dict, results: Dict) -> Dict[str, str]:
+        state["log"]["steps"].append("Collect Results")
+        context = self.sessions.get(state["session_id"])
+        return {"diagnosis": context.current_diagnosis, "treatment": context.current_treatment}
+
+    def _step_write_report(self, state: Dict, results: Dict) -> str:
+        patient = state["patient"]
+        state["log"]["steps"].append("Report Writing")
+        state["log"]["agents_consulted"].append("report_agent")
+        return report_agent.write_report(patient.get("name", ""), patient.get("age", ""), patient.get("gender", ""),
+                                         patient.get("illnesses", ""), results["collect_results"]["diagnosis"],
+                                         results["collect_results"]["treatment"])
+
+    def coordinate_monitoring_workflow(self, patient_id: str, start=None, end=None, as_series: bool = False,
+                                       session_id: str = DEFAULT_SESSION) -> Tuple[str, Optional[any]]:
+        summary, chart = monitoring_agent.analyze_patient_history(patient_id, start, end, as_series)
+        self.sessions.get(session_id).add_interaction("monitoring", summary, "monitoring_agent")
+        self.sessions.update(session_id)
+        return summary, chart
+
+    def determine_specialist_consultation(self, symptoms: str, diagnosis: str) -> Optional[str]:
+        ranked = self.rank_specialist_consultations(symptoms, diagnosis)
+        return ranked[0][0] if ranked else None
+
+    def rank_specialist_consultations(self, symptoms: str, diagnosis: str) -> List[Tuple[str, float]]:
+        # One automaton pass over the symptoms scores every specialty at once.
+        return [(specialty, score) for specialty, score in keyword_matcher.rank_specialties(symptoms)
+                if specialty in self.specialist_agents]
+
+
+
+    def validate_treatment_safety_async(self, symptoms: str, diagnosis: str, treatment: str) -> Future:
+        # Keeps the consultation's priority and carried context, but not its deadline: the
+        # user already has the plan, so the check may take as long as it needs.
+        priority = current_priority()
+        consultation = current_consultation()
+        branch = consultation.fork() if consultation is not None else None
+
+        def validate():
+            with priority_scope(priority), consultation_scope(branch):
+                return self.validate_treatment_safety(symptoms, diagnosis, treatment)
+
+        return self._safety_executor.submit(validate)
+
+    def resolve_deferred_safety(self, workflow_log: Dict, treatment_plan: str,
+                                session_id: str = DEFAULT_SESSION) -> Tuple[str, Dict[str, any]]:
+        # Blocks until the deferred check finishes, then records the final plan in the session.
+        future = workflow_log.pop("safety_pending")
+        safety_check = future.result()
+        treatment_plan = apply_safety_verdict(treatment_plan, safety_check)
+        workflow_log["safety"] = safety_check
+        context = self.sessions.get(session_id)
+        context.current_treatment = treatment_plan
+        context.add_interaction("safety", json.dumps(safety_check), "orchestrator")
+        self.sessions.update(session_id)
+        return treatment_plan, safety_check
+
+    def validate_treatment_safety(self, symptoms: str, diagnosis: str, treatment: str) -> Dict[str, any]:
+        # A known interaction or dosing error found locally is reported without the LLM; every
+        # other plan still gets the full review (contraindications, allergies, emergencies).
+        verdict = precheck_treatment_safety(treatment, context=symptoms)
+        if verdict is not None:
+            return verdict
+        prompt = self.SAFETY_PROMPT.render(symptoms=symptoms, diagnosis=diagnosis, treatment=treatment)
         try:
-            response = self.model.generate_response(prompt)
-            json_start = response.find('{')
-            json_end = response.rfind('}') + 1
-            if json_start != -1 and json_end != -1:
-                return json.loads(response[json_start:json_end])
-        except:
-            pass
+            return self.model.generate_json(prompt, SAFETY_SCHEMA, profile="safety")
+        except (ValueError, requests.RequestException) as e:
+            print(f"[Orchestrator] Safety validation failed: {e}")
         return {"safe": True, "warning": "", "risk_level": "low"}
+
+
+def _new_workflow_log() -> Dict:
+    return {"steps": [], "agents_consulted": [], "confidence_scores": {}, "recommendations": [], "degraded": []}
+
+
+def apply_safety_verdict(treatment_plan: str, safety_check: Dict[str, any]) -> str:
+    if not safety_check.get("safe", True):
+        return f"⚠️ **SAFETY ALERT**: {safety_check.get('warning', '')}\n\n{treatment_plan}"
+    return treatment_plan
+
+
+def _with_opinions(diagnosis: str, opinions: List[Tuple[str, str]]) -> str:
+    for specialist, specialist_diagnosis in opinions:
+        diagnosis = f"{diagnosis}\n\n**Specialist Opinion ({specialist}):**\n{specialist_diagnosis}"
+    return diagnosis
+
+
+def _remaining() -> float:
+    remaining = time_remaining()
+    return float("inf") if remaining is None else remaining
+
+
+def _degrade(workflow_log: Dict, stage: str, reason: str):
+    remaining = _remaining()
+    workflow_log["degraded"].append({
+        "stage": stage,
+        "reason": reason,
+        "remaining_seconds": None if remaining == float("inf") else round(max(remaining, 0.0), 1)
+    })
+    workflow_log["steps"].append(f"{stage.replace('_', ' ').title()} (degraded)")
+
+
+def _word_overlap(a: str, b: str) -> float:
+    words_a, words_b = set(a.lower().split()), set(b.lower().split())
+    return len(words_a & words_b) / len(words_a | words_b) if words_a | words_b else 1.0
+
+
+def compare_workflow_modes(orchestrator: MedicalOrchestrator, cases: List[str]) -> Dict[str, float]:
+    # Latency and rough agreement of the single-call fast mode against the multi-call workflow.
+    rows = []
+    for symptoms in cases:
+        started = time.perf_counter()
+        standard = orchestrator.coordinate_diagnosis_workflow(symptoms)
+        standard_seconds = time.perf_counter() - started
+        started = time.perf_counter()
+        fast = orchestrator.coordinate_fast_workflow(symptoms)
+        fast_seconds = time.perf_counter() - started
+        rows.append({
+            "standard_seconds": standard_seconds,
+            "fast_seconds": fast_seconds,
+            "relevance_agrees": standard[0].startswith("❌") == fast[0].startswith("❌"),
+            "safety_agrees": ("SAFETY ALERT" in standard[1]) == ("SAFETY ALERT" in fast[1]),
+            "diagnosis_overlap": _word_overlap(standard[0], fast[0]),
+            "treatment_overlap": _word_overlap(standard[1], fast[1])
+        })
+    if not rows:
+        return {}
+    return {key: sum(float(row[key]) for row in rows) / len(rows) for key in rows[0]}
+
+
+if __name__ == "__main__":
+    from backend.med_model.model_loader import load_model
+    from backend.med_model.triage_classifier import load_training_data
+
+    cases = load_training_data()[0][:5]
+    report = compare_workflow_modes(MedicalOrchestrator(load_model("diagnosis")), cases)
+    for key, value in report.items():
+        print(f"{key:>20}: {value:.2f}")
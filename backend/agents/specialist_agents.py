@@ -1,21 +1,30 @@
+import requests
+from backend.med_model.scheduler import priority_scope
+from backend.med_model.prompts import PromptTemplate
+
+TRIAGE_SCHEMA = {
+    "type": "object",
+    "required": ["urgency", "disposition"],
+    "properties": {
+        "urgency": {"type": "string", "enum": ["IMMEDIATE", "URGENT", "LESS_URGENT", "NON_URGENT"]},
+        "disposition": {"type": "string", "enum": ["911", "ED", "URGENT_CARE", "PRIMARY_CARE"]},
+        "red_flags": {"type": "array", "items": {"type": "string"}},
+        "immediate_actions": {"type": "array", "items": {"type": "string"}}
+    }
+}
+
+
 class CardiologyAgent:
-    def __init__(self, model):
-        self.model = model
-        self.specialty = "Cardiology"
-        
-    def analyze_cardiovascular_symptoms(self, symptoms: str, patient_data: dict = None) -> str:        
-        patient_context = ""
-        if patient_data:
-            patient_context = f"""
+    BACKGROUND_PROMPT = PromptTemplate("cardiology.background", """
                      Patient Background:
-                     - Age: {patient_data.get('age', 'Unknown')}
-                     - Gender: {patient_data.get('gender', 'Unknown')}  
-                     - BP History: {patient_data.get('bp_readings', 'No data')}
-                     - Current Medications: {patient_data.get('medications', 'None listed')}
-                     - Cardiac History: {patient_data.get('cardiac_history', 'No prior cardiac issues')}
-                     """
-                           
-            prompt = f"""
+                     - Age: {age}
+                     - Gender: {gender}
+                     - BP History: {bp_readings}
+                     - Current Medications: {medications}
+                     - Cardiac History: {cardiac_history}
+                     """, track=False)
+
+    ASSESSMENT_PROMPT = PromptTemplate("cardiology.assessment", """
       You are a board-certified cardiologist with 20+ years of experience. Analyze these symptoms for cardiovascular conditions.
       {patient_context}
       Current Symptoms: {symptoms}
@@ -44,16 +53,13 @@ class CardiologyAgent:
          - Follow-up recommendations
 
       Focus on actionable, evidence-based recommendations.
-      """
-        return self.model.generate_response(prompt)
+""", task="specialist", truncatable=('patient_context', 'symptoms'))
 
-    
-    def assess_chest_pain(self, symptoms: str, patient_data: dict = None) -> str:
-        prompt = f"""
+    CHEST_PAIN_PROMPT = PromptTemplate("cardiology.chest_pain", """
 You are evaluating a patient with chest pain. Use the standard chest pain assessment protocol.
 
 Patient Symptoms: {symptoms}
-Patient Data: {patient_data if patient_data else 'Limited data available'}
+Patient Data: {patient_data}
 
 Provide chest pain assessment using HEART Score approach:
 
@@ -80,7 +86,32 @@ Provide chest pain assessment using HEART Score approach:
    - Immediate interventions
    - Medications
    - Activity restrictions
-"""
+""", task="specialist", truncatable=('patient_data', 'symptoms'))
+
+    def __init__(self, model):
+        self.model = model
+        self.specialty = "Cardiology"
+
+    def consult(self, symptoms: str, patient_data: dict = None) -> str:
+        return self.analyze_cardiovascular_symptoms(symptoms, patient_data)
+        
+    def analyze_cardiovascular_symptoms(self, symptoms: str, patient_data: dict = None) -> str:        
+        patient_context = ""
+        if patient_data:
+            patient_context = self.BACKGROUND_PROMPT.render(
+                age=patient_data.get('age', 'Unknown'),
+                gender=patient_data.get('gender', 'Unknown'),
+                bp_readings=patient_data.get('bp_readings', 'No data'),
+                medications=patient_data.get('medications', 'None listed'),
+                cardiac_history=patient_data.get('cardiac_history', 'No prior cardiac issues')
+            )
+
+        prompt = self.ASSESSMENT_PROMPT.render(patient_context=patient_context, symptoms=symptoms)
+        return self.model.generate_response(prompt)
+
+    
+    def assess_chest_pain(self, symptoms: str, patient_data: dict = None) -> str:
+        prompt = self.CHEST_PAIN_PROMPT.render(symptoms=symptoms, patient_data=patient_data or 'Limited data available')
         
         return self.model.generate_response(prompt)
 
@@ -88,16 +119,11 @@ Provide chest pain assessment using HEART Score approach:
 
 
 class NeurologyAgent:    
-    def __init__(self, model):
-        self.model = model
-        self.specialty = "Neurology"
-        
-    def analyze_neurological_symptoms(self, symptoms: str, patient_data: dict = None) -> str:        
-        prompt = f"""
+    ASSESSMENT_PROMPT = PromptTemplate("neurology.assessment", """
 You are a board-certified neurologist. Analyze these symptoms for neurological conditions.
 
 Patient Symptoms: {symptoms}
-Patient History: {patient_data if patient_data else 'Limited history available'}
+Patient History: {patient_data}
 
 Provide comprehensive neurological assessment:
 
@@ -128,16 +154,12 @@ Provide comprehensive neurological assessment:
    - Follow-up timeline
 
 Focus on systematic, evidence-based neurological approach.
-"""
-        
-        return self.model.generate_response(prompt)
+""", task="specialist", truncatable=('patient_data', 'symptoms'))
 
-    
-    def assess_headache(self, symptoms: str, patient_data: dict = None) -> str:
-        prompt = f"""
+    HEADACHE_PROMPT = PromptTemplate("neurology.headache", """
                   You are conducting a headache evaluation using systematic approach.
                   Symptoms: {symptoms}
-                  Patient Data: {patient_data if patient_data else 'Limited data'}
+                  Patient Data: {patient_data}
                   Provide headache assessment:
 
                   1. **Headache Classification:**
@@ -147,7 +169,7 @@ Focus on systematic, evidence-based neurological approach.
 
                   2. **SNNOOP10 Assessment:**
                      - Systemic symptoms/signs
-                     - Neurologic symptoms/signs  
+                     - Neurologic symptoms/signs
                      - Onset sudden
                      - Older age (>50)
                      - Pattern change
@@ -167,24 +189,33 @@ Focus on systematic, evidence-based neurological approach.
                      - Preventive therapy
                      - Lifestyle modifications
                      - When to refer urgently
-                  """
-                        
-        return self.model.generate_response(prompt)
-
+""", task="specialist", truncatable=('patient_data', 'symptoms'))
 
-class PharmacologyAgent:    
     def __init__(self, model):
         self.model = model
-        self.specialty = "Clinical Pharmacology"
+        self.specialty = "Neurology"
+
+    def consult(self, symptoms: str, patient_data: dict = None) -> str:
+        return self.analyze_neurological_symptoms(symptoms, patient_data)
         
-    def analyze_medication_safety(self, medications: list, symptoms: str, patient_data: dict = None) -> str:
-        med_list = ', '.join(medications) if medications else 'No current medications'
+    def analyze_neurological_symptoms(self, symptoms: str, patient_data: dict = None) -> str:        
+        prompt = self.ASSESSMENT_PROMPT.render(symptoms=symptoms, patient_data=patient_data or 'Limited history available')
         
-        prompt = f"""
+        return self.model.generate_response(prompt)
+
+    
+    def assess_headache(self, symptoms: str, patient_data: dict = None) -> str:
+        prompt = self.HEADACHE_PROMPT.render(symptoms=symptoms, patient_data=patient_data or 'Limited data')
+                        
+        return self.model.generate_response(prompt)
+
+
+class PharmacologyAgent:    
+    MEDICATION_SAFETY_PROMPT = PromptTemplate("pharmacology.medication_safety", """
                         You are a clinical pharmacist conducting medication therapy management.
                         Current Medications: {med_list}
                         Patient Symptoms: {symptoms}
-                        Patient Data: {patient_data if patient_data else 'Limited data available'}
+                        Patient Data: {patient_data}
                         Provide comprehensive medication analysis:
 
                         1. **Drug Interaction Assessment:**
@@ -218,15 +249,12 @@ class PharmacologyAgent:
                            - Storage and administration
 
                         Prioritize patient safety and evidence-based recommendations.
-                        """
-        
-        return self.model.generate_response(prompt)
-    
-    def recommend_medication_therapy(self, diagnosis: str, patient_data: dict = None) -> str:        
-        prompt = f"""
+""", task="specialist", truncatable=('patient_data', 'med_list', 'symptoms'))
+
+    THERAPY_PROMPT = PromptTemplate("pharmacology.therapy", """
                      You are developing an evidence-based medication therapy plan.
                      Diagnosis: {diagnosis}
-                     Patient Factors: {patient_data if patient_data else 'Standard adult patient'}
+                     Patient Factors: {patient_data}
 
                      Provide medication therapy recommendations:
 
@@ -260,20 +288,32 @@ class PharmacologyAgent:
                         - When to contact provider
 
                      Base recommendations on current clinical guidelines and evidence.
-                     """
-        
-        return self.model.generate_response(prompt)
+""", task="specialist", truncatable=('patient_data', 'diagnosis'))
 
-class PsychiatryAgent:
     def __init__(self, model):
         self.model = model
-        self.specialty = "Psychiatry"
+        self.specialty = "Clinical Pharmacology"
 
-    def analyze_psychiatric_symptoms(self, symptoms: str, patient_data: dict = None) -> str:
-        prompt = f"""
+    def consult(self, symptoms: str, patient_data: dict = None) -> str:
+        return self.analyze_medication_safety((patient_data or {}).get('medications', []), symptoms, patient_data)
+        
+    def analyze_medication_safety(self, medications: list, symptoms: str, patient_data: dict = None) -> str:
+        med_list = ', '.join(medications) if medications else 'No current medications'
+        
+        prompt = self.MEDICATION_SAFETY_PROMPT.render(med_list=med_list, symptoms=symptoms, patient_data=patient_data or 'Limited data available')
+        
+        return self.model.generate_response(prompt)
+    
+    def recommend_medication_therapy(self, diagnosis: str, patient_data: dict = None) -> str:        
+        prompt = self.THERAPY_PROMPT.render(diagnosis=diagnosis, patient_data=patient_data or 'Standard adult patient')
+        
+        return self.model.generate_response(prompt)
+
+class PsychiatryAgent:
+    ASSESSMENT_PROMPT = PromptTemplate("psychiatry.assessment", """
                      You are a licensed psychiatrist with experience in diagnosing mental health conditions.
                      Patient Symptoms: {symptoms}
-                     Patient History: {patient_data if patient_data else 'Limited history available'}
+                     Patient History: {patient_data}
                      Provide a psychiatric assessment:
 
                      1. **Primary Concern:**
@@ -292,20 +332,25 @@ class PsychiatryAgent:
                         - Psychotherapy suggestions
                         - Pharmacological options
                         - Follow-up plan and referrals
-                     """
-        return self.model.generate_response(prompt)
-
+""", task="specialist", truncatable=('patient_data', 'symptoms'))
 
-class PulmonologyAgent:
     def __init__(self, model):
         self.model = model
-        self.specialty = "Pulmonology"
+        self.specialty = "Psychiatry"
 
-    def analyze_respiratory_symptoms(self, symptoms: str, patient_data: dict = None) -> str:
-        prompt = f"""
+    def consult(self, symptoms: str, patient_data: dict = None) -> str:
+        return self.analyze_psychiatric_symptoms(symptoms, patient_data)
+
+    def analyze_psychiatric_symptoms(self, symptoms: str, patient_data: dict = None) -> str:
+        prompt = self.ASSESSMENT_PROMPT.render(symptoms=symptoms, patient_data=patient_data or 'Limited history available')
+        return self.model.generate_response(prompt)
+
+
+class PulmonologyAgent:
+    ASSESSMENT_PROMPT = PromptTemplate("pulmonology.assessment", """
                   You are a board-certified pulmonologist. Evaluate the following respiratory symptoms.
                   Symptoms: {symptoms}
-                  Patient Data: {patient_data if patient_data else 'Limited information'}
+                  Patient Data: {patient_data}
                   Provide a comprehensive respiratory assessment:
 
                   1. **Possible Diagnoses:**
@@ -326,20 +371,25 @@ class PulmonologyAgent:
                   5. **Follow-Up:**
                      - Timeline for reassessment
                      - Preventive advice and lifestyle recommendations
-                  """
-        return self.model.generate_response(prompt)
-
+""", task="specialist", truncatable=('patient_data', 'symptoms'))
 
-class GastroenterologyAgent:
     def __init__(self, model):
         self.model = model
-        self.specialty = "Gastroenterology"
+        self.specialty = "Pulmonology"
 
-    def analyze_digestive_symptoms(self, symptoms: str, patient_data: dict = None) -> str:
-        prompt = f"""
+    def consult(self, symptoms: str, patient_data: dict = None) -> str:
+        return self.analyze_respiratory_symptoms(symptoms, patient_data)
+
+    def analyze_respiratory_symptoms(self, symptoms: str, patient_data: dict = None) -> str:
+        prompt = self.ASSESSMENT_PROMPT.render(symptoms=symptoms, patient_data=patient_data or 'Limited information')
+        return self.model.generate_response(prompt)
+
+
+class GastroenterologyAgent:
+    ASSESSMENT_PROMPT = PromptTemplate("gastroenterology.assessment", """
                   You are a board-certified gastroenterologist. Analyze the following symptoms related to digestive health.
                   Symptoms: {symptoms}
-                  Patient Data: {patient_data if patient_data else 'Limited data available'}
+                  Patient Data: {patient_data}
                   Provide a comprehensive GI assessment:
 
                   1. **Possible Diagnoses:**
@@ -359,19 +409,24 @@ class GastroenterologyAgent:
                   5. **When to Refer:**
                      - Emergency symptoms
                      - Need for surgical or subspecialty evaluation
-                  """
-        return self.model.generate_response(prompt)
+""", task="specialist", truncatable=('patient_data', 'symptoms'))
 
-class DermatologyAgent:
     def __init__(self, model):
         self.model = model
-        self.specialty = "Dermatology"
+        self.specialty = "Gastroenterology"
 
-    def analyze_dermatological_symptoms(self, symptoms: str, patient_data: dict = None) -> str:
-        prompt = f"""
+    def consult(self, symptoms: str, patient_data: dict = None) -> str:
+        return self.analyze_digestive_symptoms(symptoms, patient_data)
+
+    def analyze_digestive_symptoms(self, symptoms: str, patient_data: dict = None) -> str:
+        prompt = self.ASSESSMENT_PROMPT.render(symptoms=symptoms, patient_data=patient_data or 'Limited data available')
+        return self.model.generate_response(prompt)
+
+class DermatologyAgent:
+    ASSESSMENT_PROMPT = PromptTemplate("dermatology.assessment", """
                   You are a board-certified dermatologist. Analyze the following skin-related symptoms.
                   Symptoms: {symptoms}
-                  Patient Data: {patient_data if patient_data else 'Limited data available'}
+                  Patient Data: {patient_data}
 
                   Provide a comprehensive dermatological assessment:
 
@@ -392,20 +447,25 @@ class DermatologyAgent:
                   5. **Referral/Emergency Criteria:**
                      - When to refer to a dermatology clinic
                      - Red flag symptoms needing urgent attention
-                  """
-        return self.model.generate_response(prompt)
+""", task="specialist", truncatable=('patient_data', 'symptoms'))
 
-class EndocrinologyAgent:
     def __init__(self, model):
         self.model = model
-        self.specialty = "Endocrinology"
+        self.specialty = "Dermatology"
 
-    def analyze_endocrine_symptoms(self, symptoms: str, patient_data: dict = None) -> str:
-        prompt = f"""
+    def consult(self, symptoms: str, patient_data: dict = None) -> str:
+        return self.analyze_dermatological_symptoms(symptoms, patient_data)
+
+    def analyze_dermatological_symptoms(self, symptoms: str, patient_data: dict = None) -> str:
+        prompt = self.ASSESSMENT_PROMPT.render(symptoms=symptoms, patient_data=patient_data or 'Limited data available')
+        return self.model.generate_response(prompt)
+
+class EndocrinologyAgent:
+    ASSESSMENT_PROMPT = PromptTemplate("endocrinology.assessment", """
 You are a board-certified endocrinologist. Analyze the following symptoms from an endocrine perspective.
 
 Symptoms: {symptoms}
-Patient Data: {patient_data if patient_data else 'Limited data available'}
+Patient Data: {patient_data}
 
 Provide a structured assessment:
 
@@ -424,18 +484,23 @@ Provide a structured assessment:
 5. **Referral or Follow-up:**
    - When to refer to an endocrinology clinic
    - Follow-up recommendations based on condition
-"""
+""", task="specialist", truncatable=('patient_data', 'symptoms'))
+
+    def __init__(self, model):
+        self.model = model
+        self.specialty = "Endocrinology"
+
+    def consult(self, symptoms: str, patient_data: dict = None) -> str:
+        return self.analyze_endocrine_symptoms(symptoms, patient_data)
+
+    def analyze_endocrine_symptoms(self, symptoms: str, patient_data: dict = None) -> str:
+        prompt = self.ASSESSMENT_PROMPT.render(symptoms=symptoms, patient_data=patient_data or 'Limited data available')
         return self.model.generate_response(prompt)
 
 
 
 class EmergencyAgent:    
-    def __init__(self, model):
-        self.model = model
-        self.specialty = "Emergency Medicine"
-        
-    def triage_urgency(self, symptoms: str) -> dict:        
-        prompt = f"""
+    TRIAGE_PROMPT = PromptTemplate("emergency.triage", """
 You are an emergency medicine physician conducting initial triage.
 
 Patient Symptoms: {symptoms}
@@ -443,7 +508,7 @@ Assess urgency level and provide triage decision:
 
 1. **Urgency Level:**
    - IMMEDIATE (life-threatening, <15 minutes)
-   - URGENT (serious but stable, <1 hour)  
+   - URGENT (serious but stable, <1 hour)
    - LESS URGENT (stable, <4 hours)
    - NON-URGENT (routine care)
 
@@ -472,16 +537,19 @@ Respond in JSON format:
     "red_flags": ["flag1", "flag2"],
     "immediate_actions": ["action1", "action2"]
 }}
-"""
-        response = self.model.generate_response(prompt)
+""", task="triage", truncatable=('symptoms',))
+
+    def __init__(self, model):
+        self.model = model
+        self.specialty = "Emergency Medicine"
+        
+    def triage_urgency(self, symptoms: str) -> dict:        
+        prompt = self.TRIAGE_PROMPT.render(symptoms=symptoms)
         try:
-            import json
-            json_start = response.find('{')
-            json_end = response.rfind('}') + 1
-            if json_start != -1 and json_end != -1:
-                return json.loads(response[json_start:json_end])
-        except:
-            pass
+            with priority_scope("emergency"):
+                return self.model.generate_json(prompt, TRIAGE_SCHEMA, profile="triage")
+        except (ValueError, requests.RequestException) as e:
+            print(f"[EmergencyAgent] Triage parsing failed: {e}")
         return {
             "urgency": "LESS_URGENT",
             "disposition": "PRIMARY_CARE", 
@@ -1,17 +1,9 @@
 import re
-from backend.med_model.model_loader import load_model  
+from backend.med_model.model_loader import load_model
+from backend.med_model.prompts import PromptTemplate
 
 
-def clean_model_output(text):
-    text = re.sub(r'\[.*?\]', '', text)
-    text = re.sub(r'\(([^)]*(confidence|citation|reference)[^)]*)\)', '', text, flags=re.IGNORECASE)
-    return text.strip()
-
-
-#=======
-def generate_treatment(symptoms, diagnosis, model=None):
-    model = model or load_model("treatment")
-    prompt = f"""
+TREATMENT_PROMPT = PromptTemplate("treatment.plan", """
 You are a medical treatment recommendation assistant
 A patient presents with:
 - Symptoms: {symptoms}
@@ -30,7 +22,19 @@ Avoid:
 - Confidence scores or disclaimers
 - Vague generalizations
 
-"""
-    reponse=model.generate_response(prompt)
+""", task="treatment", truncatable=('diagnosis', 'symptoms'))
+
+
+def clean_model_output(text):
+    text = re.sub(r'\[.*?\]', '', text)
+    text = re.sub(r'\(([^)]*(confidence|citation|reference)[^)]*)\)', '', text, flags=re.IGNORECASE)
+    return text.strip()
+
+
+#=======
+def generate_treatment(symptoms, diagnosis, model=None):
+    model = model or load_model("treatment")
+    prompt = TREATMENT_PROMPT.render(symptoms=symptoms, diagnosis=diagnosis)
+    reponse=model.generate_response(prompt, profile="treatment")
     return reponse
 
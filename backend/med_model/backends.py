@@ -0,0 +1,118 @@
+import os
+import time
+import threading
+from typing import Dict, List, Sequence, Tuple
+import requests
+from backend.med_model.resilience import (BackendUnavailable, breaker_for, guarded_call, bounded_by_deadline,
+                                         CONNECT_TIMEOUT)
+
+# Comma-separated Ollama base URLs; requests are spread across all of them.
+BACKEND_URLS = [url.strip().rstrip("/") for url in
+                os.environ.get("OLLAMA_BACKENDS", "http://localhost:11434").split(",") if url.strip()]
+# How often to re-read which models each node has loaded (GET /api/ps).
+RESIDENCY_REFRESH_SECONDS = 30.0
+# Routing cost of a node that would have to load the model first, in queued requests.
+COLD_LOAD_PENALTY = 4
+
+
+class Backend:
+    def __init__(self, url: str):
+        self.url = url
+        self.generate_url = f"{url}/api/generate"
+        self.breaker = breaker_for(url)
+        self.outstanding = 0
+        self.served = 0
+        self.resident = set()
+        self.residency_checked = 0.0
+
+    def refresh_residency(self):
+        self.residency_checked = time.monotonic()
+        try:
+            response = requests.get(f"{self.url}/api/ps", timeout=(CONNECT_TIMEOUT, 1.0))
+            response.raise_for_status()
+            self.resident = {model["name"] for model in response.json().get("models", [])}
+        except (requests.RequestException, ValueError):
+            pass  # keep the last known residency; the breaker tracks node health
+
+    def snapshot(self) -> Dict[str, object]:
+        return {"outstanding": self.outstanding, "served": self.served,
+                "resident": sorted(self.resident), "breaker": self.breaker.snapshot()["state"]}
+
+
+def _matches(resident: set, model: str) -> bool:
+    # /api/ps reports tagged names ("MedExpert:latest") while we usually send untagged ones.
+    return model in resident or f"{model}:latest" in resident
+
+
+class BackendPool:
+    def __init__(self, urls: Sequence[str] = BACKEND_URLS):
+        if not urls:
+            raise ValueError("At least one Ollama backend URL is required")
+        self.backends = [Backend(url) for url in urls]
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+
+    def _refresh_stale(self):
+        # Concurrent callers wait for an in-progress refresh rather than routing on stale data.
+        with self._refresh_lock:
+            now = time.monotonic()
+            for backend in self.backends:
+                if now - backend.residency_checked >= RESIDENCY_REFRESH_SECONDS:
+                    backend.refresh_residency()
+
+    def choose(self, model: str, exclude: Sequence[Backend] = ()) -> Backend:
+        # Least outstanding requests, with nodes that don't hold `model` in memory charged
+        # COLD_LOAD_PENALTY extra. Excluded nodes are only used when nothing else is left.
+        if len(self.backends) > 1:
+            self._refresh_stale()
+        with self._lock:
+            healthy = [backend for backend in self.backends if not backend.breaker.is_open()]
+            if not healthy:
+                raise BackendUnavailable(f"All {len(self.backends)} model backends are unavailable")
+            candidates = [backend for backend in healthy if backend not in exclude] or healthy
+            backend = min(candidates, key=lambda b: b.outstanding + (0 if _matches(b.resident, model) else COLD_LOAD_PENALTY))
+            backend.outstanding += 1
+            return backend
+
+    def release(self, backend: Backend):
+        with self._lock:
+            backend.outstanding -= 1
+
+    def send(self, payload: Dict, stream: bool, read_timeout: float,
+             tried: List[Backend]) -> Tuple[requests.Response, Backend]:
+        # One attempt on the best node. On success the node stays leased until release().
+        backend = self.choose(payload["model"], tried)
+        tried.append(backend)
+        client_bound = bounded_by_deadline(read_timeout)
+
+        def post():
+            response = requests.post(backend.generate_url, json=payload, stream=stream,
+                                     timeout=(CONNECT_TIMEOUT, read_timeout))
+            try:
+                response.raise_for_status()
+            except requests.HTTPError:
+                response.close()
+                raise
+            return response
+
+        try:
+            response = guarded_call(backend.breaker, post, client_bound)
+        except BaseException:
+            self.release(backend)
+            raise
+        with self._lock:
+            backend.served += 1
+            backend.resident.add(payload["model"])
+        return response, backend
+
+    def ensure_available(self):
+        # Cheap pre-check so callers fail before queueing for a scheduler slot.
+        if all(backend.breaker.is_open() for backend in self.backends):
+            raise BackendUnavailable(f"All {len(self.backends)} model backends are unavailable")
+
+    def stats(self) -> Dict[str, Dict[str, object]]:
+        with self._lock:
+            return {backend.url: backend.snapshot() for backend in self.backends}
+
+
+default_pool = BackendPool()
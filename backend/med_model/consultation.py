@@ -0,0 +1,132 @@
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+# "context": carry Ollama's returned KV `context` from one call to the next.
+# "prefix": send the patient presentation as a shared `system` prefix on every call.
+CONTEXT_MODES = ("context", "prefix", "off")
+PATIENT_REFERENCE = "(the patient presentation given earlier in this consultation)"
+SYSTEM_PREFIX = "You are assisting with a single medical consultation.\n\nPatient presentation:\n{patient_text}"
+# Matches num_ctx in generation_profiles.json. A carried context longer than the window has
+# been truncated from the front by Ollama, so the patient presentation is no longer in it.
+DEFAULT_NUM_CTX = 4096
+
+_local = threading.local()
+
+
+class Consultation:
+    def __init__(self, patient_text: str = "", mode: str = "context"):
+        if mode not in CONTEXT_MODES:
+            raise ValueError(f"Unsupported consultation mode: {mode}")
+        self.patient_text = patient_text.strip()
+        self.mode = mode
+        self.context = None
+        self.context_model = None
+        self.num_ctx = DEFAULT_NUM_CTX
+        self.read_only = False
+        self.calls = []
+        self._lock = threading.Lock()
+
+    @property
+    def system(self) -> Optional[str]:
+        if self.mode == "prefix" and self.patient_text:
+            return SYSTEM_PREFIX.format(patient_text=self.patient_text)
+        return None
+
+    def primed(self) -> bool:
+        # Once the model has seen the patient text (via system prefix or carried context),
+        # later prompts can refer to it instead of repeating it.
+        if self.mode == "context":
+            return self.context is not None and len(self.context) <= self.num_ctx
+        return self.mode == "prefix"
+
+    def reference(self, value: str) -> str:
+        # Short presentations are cheaper to repeat than to reference.
+        if len(self.patient_text) > len(PATIENT_REFERENCE) and self.primed() and value.strip() == self.patient_text:
+            return PATIENT_REFERENCE
+        return value
+
+    def apply(self, payload: Dict) -> Dict:
+        # A KV context is only meaningful to the model that produced it. Another model gets
+        # the presentation as a system prefix instead, since the prompt may only refer to it.
+        if self.primed() and self.mode == "context" and payload.get("model") == self.context_model:
+            payload["context"] = self.context
+        elif self.system or (self.primed() and self.patient_text):
+            payload["system"] = SYSTEM_PREFIX.format(patient_text=self.patient_text)
+        return payload
+
+    def record(self, data: Dict, payload: Optional[Dict] = None):
+        payload = payload or {}
+        with self._lock:
+            if self.mode == "context" and not self.read_only and data.get("context"):
+                self.context = data["context"]
+                self.context_model = payload.get("model", data.get("model"))
+                self.num_ctx = payload.get("options", {}).get("num_ctx", self.num_ctx)
+            self.calls.append({
+                "prompt_eval_count": data.get("prompt_eval_count", 0),
+                "prompt_eval_ms": data.get("prompt_eval_duration", 0) / 1e6,
+                "eval_count": data.get("eval_count", 0),
+                "total_ms": data.get("total_duration", 0) / 1e6
+            })
+
+    def fork(self) -> "Consultation":
+        # Concurrent branches (e.g. parallel specialists) share the current context but
+        # must not overwrite it for the main line of the consultation.
+        branch = Consultation(self.patient_text, self.mode)
+        branch.context = self.context
+        branch.context_model = self.context_model
+        branch.num_ctx = self.num_ctx
+        branch.read_only = True
+        branch.calls = self.calls
+        branch._lock = self._lock
+        return branch
+
+    def summary(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                "calls": len(self.calls),
+                "prompt_tokens": sum(call["prompt_eval_count"] for call in self.calls),
+                "prompt_eval_ms": sum(call["prompt_eval_ms"] for call in self.calls),
+                "total_ms": sum(call["total_ms"] for call in self.calls)
+            }
+
+
+def current_consultation() -> Optional[Consultation]:
+    return getattr(_local, "consultation", None)
+
+
+@contextmanager
+def consultation_scope(consultation: Optional[Consultation]):
+    previous = current_consultation()
+    _local.consultation = consultation
+    try:
+        yield consultation
+    finally:
+        _local.consultation = previous
+
+
+def benchmark_consultation(symptoms: str, modes: List[str] = ("off", "context", "prefix")) -> Dict[str, Dict[str, float]]:
+    # Runs the relevance -> diagnosis -> treatment -> safety chain once per mode and compares prefill.
+    from backend.agents import diagnosis_agent, treatment_agent
+    from backend.agents.orchestrator_agent import MedicalOrchestrator
+    from backend.med_model.model_loader import load_model
+
+    orchestrator = MedicalOrchestrator(load_model("diagnosis"))
+    results = {}
+    for mode in modes:
+        consultation = Consultation(symptoms, mode)
+        with consultation_scope(consultation):
+            diagnosis_agent.is_input_medical_llm(symptoms)
+            diagnosis = diagnosis_agent.generate_diagnosis(symptoms)
+            treatment = treatment_agent.generate_treatment(symptoms, diagnosis, orchestrator.model)
+            orchestrator.validate_treatment_safety(symptoms, diagnosis, treatment)
+        results[mode] = consultation.summary()
+    return results
+
+
+if __name__ == "__main__":
+    import sys
+    text = " ".join(sys.argv[1:]) or "A 54 year old male with type 2 diabetes reports dizziness and lower abdominal pain."
+    for mode, result in benchmark_consultation(text).items():
+        print(f"{mode:>8}: {result['calls']} calls, {result['prompt_tokens']} prompt tokens, "
+              f"{result['prompt_eval_ms']:.0f} ms prefill, {result['total_ms']:.0f} ms total")
@@ -1,31 +1,402 @@
+import os
+import re
+import json
+import time
+import threading
 import requests
-OLLAMA_URL = "http://localhost:11434/api/generate"
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from contextlib import contextmanager
+from backend.med_model.scheduler import scheduler, resolve_priority, TASK_PRIORITIES
+from backend.med_model.consultation import current_consultation, consultation_scope
+from backend.med_model.resilience import (call_with_retry, effective_deadline, deadline_scope, current_deadline,
+                                         time_remaining, DEFAULT_DEADLINE)
+from backend.med_model.backends import BackendPool, default_pool
+from backend.med_model.singleflight import SingleFlight, request_key
+from backend.med_model.structured import validate_schema, JSONObjectExtractor, parse_json_object
+
+# Per-task model, token cap, context window, sampling and stop sequences. Tasks sharing a
+# model should keep the same num_ctx: Ollama reloads the model whenever it changes.
+GENERATION_PROFILES_PATH = os.environ.get(
+    "GENERATION_PROFILES", os.path.join(os.path.dirname(__file__), "generation_profiles.json"))
+PROFILE_LATENCY_WINDOW = 500
+# Re-send a non-streaming request to a second node once it has run longer than this
+# percentile of its profile's recent latencies (0 disables hedging).
+HEDGE_PERCENTILE = float(os.environ.get("OLLAMA_HEDGE_PERCENTILE", "0"))
+HEDGE_MIN_SAMPLES = 20
+# Profiles with a "cascade" policy try its smaller model first and escalate to the profile's
+# own model only when the answer fails the policy's checks (OLLAMA_CASCADE=0 turns this off).
+CASCADE_ENABLED = os.environ.get("OLLAMA_CASCADE", "1") != "0"
+# Free-text answers that hedge or refuse are escalated.
+_UNSURE_RE = re.compile(r"\b(i'?m not sure|i am not sure|i (?:cannot|can'?t|am unable to) (?:answer|help|determine)|"
+                        r"as an ai|i don'?t know)\b", re.IGNORECASE)
+
+# Yes/no classification: a few tokens cover "Yes", "**No**", "yes." and the like.
+CLASSIFY_MAX_TOKENS = 4
+YES_WORDS = {"yes", "y", "true"}
+NO_WORDS = {"no", "n", "not", "false"}
+_WORD_RE = re.compile(r"[a-z]+")
+
+
+def _first_word(text, final=False):
+    # The first word is only settled once something follows it (or the stream has ended).
+    match = _WORD_RE.search(text.lower())
+    if match is None or (match.end() == len(text) and not final):
+        return None
+    return match.group()
+
+
+def load_profiles(path=GENERATION_PROFILES_PATH):
+    with open(path) as f:
+        return json.load(f)
+
+
+PROFILES = load_profiles()
+
+_latencies = {}
+_latency_lock = threading.Lock()
+
+
+def _record_latency(profile, seconds, data):
+    with _latency_lock:
+        stats = _latencies.setdefault(profile, {"calls": 0, "eval_tokens": 0, "ms": deque(maxlen=PROFILE_LATENCY_WINDOW)})
+        stats["calls"] += 1
+        stats["eval_tokens"] += (data or {}).get("eval_count", 0)
+        stats["ms"].append(1000 * seconds)
+
+
+def _hedge_after(profile):
+    if not HEDGE_PERCENTILE:
+        return None
+    with _latency_lock:
+        stats = _latencies.get(profile)
+        if stats is None or len(stats["ms"]) < HEDGE_MIN_SAMPLES:
+            return None
+        ms = sorted(stats["ms"])
+    return ms[min(len(ms) - 1, int(HEDGE_PERCENTILE * len(ms)))] / 1000
+
+
+in_flight = SingleFlight()
+
+
+def coalesced_requests():
+    return in_flight.stats()
+
+
+_hedge_counts = {"hedged": 0, "hedge_won": 0}
+_hedge_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="ollama-hedge")
+
+
+def hedge_stats():
+    with _latency_lock:
+        return dict(_hedge_counts)
+
+
+def profile_stats():
+    with _latency_lock:
+        report = {}
+        for profile, stats in _latencies.items():
+            ms = sorted(stats["ms"])
+            report[profile] = {
+                "calls": stats["calls"],
+                "eval_tokens": stats["eval_tokens"],
+                "mean_ms": sum(ms) / len(ms),
+                "p50_ms": ms[len(ms) // 2],
+                "p95_ms": ms[min(len(ms) - 1, int(0.95 * len(ms)))]
+            }
+        return report
+
+
+_cascade_counts = {}
+
+
+def _record_cascade(profile, escalated, small_seconds, large_seconds=0.0):
+    with _latency_lock:
+        stats = _cascade_counts.setdefault(profile, {"calls": 0, "escalated": 0, "small_ms": 0.0, "large_ms": 0.0})
+        stats["calls"] += 1
+        stats["escalated"] += int(escalated)
+        stats["small_ms"] += 1000 * small_seconds
+        stats["large_ms"] += 1000 * large_seconds
+
+
+def cascade_stats():
+    # Savings compare the time spent (small model, plus the profile's model after each
+    # escalation) with sending every call straight to the profile's model at its mean latency.
+    # With the cascade on, that latency is only measured on escalations. Until one happens
+    # (or the profile runs without the cascade) saved_ms stays None, and escalations_avoided
+    # counts the calls the small model took off the profile's model.
+    baseline = profile_stats()
+    with _latency_lock:
+        report = {}
+        for profile, stats in _cascade_counts.items():
+            mean_ms = baseline.get(profile, {}).get("mean_ms")
+            spent = stats["small_ms"] + stats["large_ms"]
+            saved = None if mean_ms is None else stats["calls"] * mean_ms - spent
+            report[profile] = {
+                **stats,
+                "escalations_avoided": stats["calls"] - stats["escalated"],
+                "escalation_rate": stats["escalated"] / stats["calls"],
+                "saved_ms": saved,
+                "saved_pct": None if saved is None else saved / (stats["calls"] * mean_ms)
+            }
+        return report
+
+
+def _text_ok(data, policy):
+    text = data.get("response", "").strip()
+    return (len(text) >= policy.get("min_chars", 1) and data.get("done_reason") != "length"
+            and not _UNSURE_RE.search(text))
+
+
+def _fields_ok(result, policy):
+    # "require": {"field": [allowed values, ...]} for JSON answers and yes/no decisions.
+    return all(result.get(field) in allowed for field, allowed in policy.get("require", {}).items())
+
+
+def _deadline(profile):
+    # The profile's own timeout, cut short by any workflow deadline in scope.
+    return effective_deadline(PROFILES.get(profile, {}).get("timeout", DEFAULT_DEADLINE))
+
 
 class OllamaModel:
-    def __init__(self, model_name):
+    def __init__(self, model_name, task_type=None, backends=None):
         self.model_name = model_name
+        self.task_type = task_type
+        # A list of Ollama base URLs gives this model its own pool; otherwise OLLAMA_BACKENDS is used.
+        self.pool = BackendPool(backends) if backends else default_pool
+        self._cascade_models = {}
+
+    def generate_response(self, prompt, priority=None, profile=None):
+        return self._cascade(profile, lambda model: model._generate(prompt, priority, profile), _text_ok)["response"]
+
+    def generate_structured(self, prompt, schema, priority=None, profile=None):
+        return self._cascade(profile, lambda model: model._structured(prompt, schema, priority, profile), _fields_ok)
+
+    def generate_json(self, prompt, schema=None, priority=None, profile=None):
+        return self._cascade(profile, lambda model: model._json(prompt, schema, priority, profile), _fields_ok)
+
+    def classify_yes_no(self, prompt, priority=None, profile=None):
+        return self._cascade(profile, lambda model: model._yes_no(prompt, priority, profile),
+                             lambda result, policy: result["decision"] is not None and _fields_ok(result, policy))
+
+    def _cascade(self, profile, call, accept):
+        # call(model) runs the request on a model; accept(result, policy) decides whether the
+        # smaller model's answer stands. Unparseable answers and failed calls escalate too.
+        profile = profile or self.task_type or "default"
+        policy = PROFILES.get(profile, {}).get("cascade") if CASCADE_ENABLED else None
+        consultation = current_consultation()
+        if not policy or policy["model"] == self.model_name:
+            return call(self)
+        if consultation is not None and consultation.mode == "context" and consultation.context is not None:
+            return call(self)  # the carried KV context only means something to this model
+        started = time.perf_counter()
+        try:
+            # A forked consultation keeps the smaller model's context out of the main line.
+            with consultation_scope(consultation.fork() if consultation is not None else None):
+                result = call(self._cascade_model(policy["model"]))
+            accepted = accept(result, policy)
+        except (ValueError, requests.RequestException) as e:
+            print(f"[Cascade] {profile} on {policy['model']} failed, escalating: {e}")
+            accepted = False
+        small_seconds = time.perf_counter() - started
+        if accepted:
+            _record_cascade(profile, False, small_seconds)
+            return result
+        started = time.perf_counter()
+        try:
+            return call(self)
+        finally:
+            _record_cascade(profile, True, small_seconds, time.perf_counter() - started)
+
+    def _cascade_model(self, model_name):
+        model = self._cascade_models.get(model_name)
+        if model is None:
+            model = self._cascade_models[model_name] = OllamaModel(model_name, self.task_type)
+            model.pool = self.pool
+        return model
+
+    def _priority(self, profile, priority):
+        # A profile with its own priority class (treatment on the diagnosis model) keeps it;
+        # helper profiles such as intent or safety run at the model's task priority.
+        return resolve_priority(profile if profile in TASK_PRIORITIES else self.task_type, priority)
+
+    def _stats_key(self, profile):
+        # A cascade runs a profile on a smaller model; its latencies and parse failures are
+        # kept apart so they don't skew the profile's own numbers (or its hedging threshold).
+        primary = PROFILES.get(profile, {}).get("model")
+        return profile if primary in (None, self.model_name) else f"{profile}@{self.model_name}"
+
+    def _structured(self, prompt, schema, priority, profile):
+        # Ollama constrains decoding to `schema`; we still validate, since older servers ignore it.
+        data = self._generate(prompt, priority, profile, format=schema)
+        result = json.loads(data["response"])
+        errors = validate_schema(result, schema)
+        if errors:
+            raise ValueError(f"Response does not match schema: {'; '.join(errors)}")
+        return result
 
-    
-    def generate_response(self, prompt):
+    def _json(self, prompt, schema, priority, profile):
+        extractor = JSONObjectExtractor()
+        text = self._stream(prompt, priority, profile, "json", lambda chunk, text: extractor.feed(chunk) is not None)
+        # A coalesced call gets the leader's text without having fed its own extractor.
+        extractor.feed(text)
+        return parse_json_object(extractor.result, schema, self._stats_key(profile or self.task_type or "default"))
+
+    def _yes_no(self, prompt, priority, profile):
+        # Only the first word matters, so cap decoding and hang up as soon as it is complete.
+        started = time.perf_counter()
+        text = self._stream(prompt, priority, profile, "yes_no", lambda chunk, text: _first_word(text) is not None,
+                            num_predict=CLASSIFY_MAX_TOKENS)
+        word = _first_word(text, final=True)
+        decision = True if word in YES_WORDS else False if word in NO_WORDS else None
+        return {"decision": decision, "answer": text.strip(), "decode_ms": 1000 * (time.perf_counter() - started)}
+
+    def _payload(self, prompt, profile, stream, extra, options):
+        profile = profile or self.task_type or "default"
         payload = {
             "model": self.model_name,
             "prompt": prompt,
-            "stream": False
+            "stream": stream,
+            **extra
         }
+        merged = {**PROFILES.get(profile, {}).get("options", {}), **options}
+        if merged:
+            payload["options"] = merged
+        return profile, payload
+
+    def _stream(self, prompt, priority, profile, kind, stop_when, **options):
+        # Streams the generation until stop_when(chunk, text_so_far) is true. Closing the
+        # connection early makes Ollama stop generating. `kind` names the stop rule, so
+        # identical concurrent streams that would stop at the same point can be coalesced.
+        profile, payload = self._payload(prompt, profile, True, {}, options)
+        consultation = current_consultation()
+        if consultation is not None:
+            consultation.apply(payload)
+        slot_priority = self._priority(profile, priority)
+
+        def run():
+            text = ""
+            final = None
+            _deadline(profile)
+            self.pool.ensure_available()
+            with scheduler.slot(slot_priority, time_remaining()):
+                started = time.perf_counter()
+                deadline = _deadline(profile)
+                with self._post(payload, deadline, stream=True) as response:
+                    for line in response.iter_lines():
+                        if time.perf_counter() - started > deadline:
+                            raise requests.Timeout(f"{profile} generation exceeded its {deadline:.0f}s deadline")
+                        if not line:
+                            continue
+                        chunk = json.loads(line)
+                        text += chunk.get("response", "")
+                        if chunk.get("done"):
+                            final = chunk
+                        if stop_when(chunk.get("response", ""), text) or final is not None:
+                            break
+                _record_latency(self._stats_key(profile), time.perf_counter() - started, final)
+            return text, final
+
+        # The priority is part of the key: an emergency caller must not wait behind a
+        # background request that happens to have the same payload.
+        text, final = in_flight.do(request_key("stream", kind, slot_priority, payload), run)
+        if consultation is not None and final is not None:
+            consultation.record(final, payload)
+        return text
+
+    @contextmanager
+    def _post(self, payload, deadline, stream=False, tried=None):
+        # Retries may move to another node; `tried` steers them (and hedges) away from nodes already used.
+        tried = [] if tried is None else tried
+        response, backend = call_with_retry(lambda read_timeout: self.pool.send(payload, stream, read_timeout, tried),
+                                            deadline)
+        try:
+            yield response
+        finally:
+            response.close()
+            self.pool.release(backend)
+
+    def _post_json(self, payload, deadline, tried):
+        with self._post(payload, deadline, tried=tried) as response:
+            return response.json()
 
-        response = requests.post(OLLAMA_URL, json=payload)
-        response.raise_for_status()
-        return response.json()["response"]
+    def _post_hedged(self, payload, profile, priority):
+        deadline = _deadline(profile)
+        hedge_after = _hedge_after(self._stats_key(profile))
+        if hedge_after is None or len(self.pool.backends) < 2:
+            return self._post_json(payload, deadline, [])
+        # The losing request is abandoned, not cancelled: Ollama finishes it. The hedge therefore
+        # takes a scheduler slot of its own, held until both requests are done, so in-flight
+        # requests never exceed MAX_CONCURRENCY (and there is no hedge when none is free).
+        tried = []
+        expires = current_deadline()
 
+        def post():
+            # The workflow deadline is thread-local; carry it over so the breaker can tell a
+            # caller's deadline from a backend timeout.
+            with deadline_scope(expires):
+                return self._post_json(payload, deadline, tried)
+
+        primary = _hedge_executor.submit(post)
+        done, _ = wait([primary], timeout=hedge_after)
+        if done or not scheduler.try_acquire(priority):
+            return primary.result()
+        hedge = _hedge_executor.submit(post)
+        with _latency_lock:
+            _hedge_counts["hedged"] += 1
+        running = [2]
+        running_lock = threading.Lock()
+
+        def settle(_):
+            # Whichever request finishes last gives back the extra slot; the caller's own slot
+            # covers the other one until then.
+            with running_lock:
+                running[0] -= 1
+                last = running[0] == 0
+            if last:
+                scheduler.release(priority)
+
+        primary.add_done_callback(settle)
+        hedge.add_done_callback(settle)
+        pending = {primary, hedge}
+        while True:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None or not pending:
+                    if future is hedge and future.exception() is None:
+                        with _latency_lock:
+                            _hedge_counts["hedge_won"] += 1
+                    return future.result()
+
+    def _generate(self, prompt, priority=None, profile=None, **extra):
+        profile, payload = self._payload(prompt, profile, False, extra, {})
+        consultation = current_consultation()
+        if consultation is not None:
+            consultation.apply(payload)
+        slot_priority = self._priority(profile, priority)
+
+        def run():
+            _deadline(profile)
+            self.pool.ensure_available()
+            with scheduler.slot(slot_priority, time_remaining()):
+                started = time.perf_counter()
+                data = self._post_hedged(payload, profile, slot_priority)
+                elapsed = time.perf_counter() - started
+            _record_latency(self._stats_key(profile), elapsed, data)
+            return data
+
+        # Identical concurrent requests (a double-click, a common complaint) share one generation,
+        # as long as they queue at the same priority.
+        data = in_flight.do(request_key("generate", slot_priority, payload), run)
+        if consultation is not None:
+            consultation.record(data, payload)
+        return data
 
 
 def load_model(task_type):
-    if task_type in ["diagnosis", "treatment"]:
-        return OllamaModel("OussamaELALLAM/MedExpert") 
-    elif task_type in ["monitoring", "report"]:
-        return OllamaModel("potaTOES33/healthmateai") 
-    else:
+    if task_type not in PROFILES:
         raise ValueError(f"Unsupported task type: {task_type}")
+    return OllamaModel(PROFILES[task_type]["model"], task_type)
 
 def query_medical_qa(question: str) -> str:
     prompt = (
@@ -33,12 +404,4 @@ def query_medical_qa(question: str) -> str:
         f"Question: {question}\nAnswer:"
     )
 
-    payload = {
-        "model": "OussamaELALLAM/MedExpert",  
-        "prompt": prompt,
-        "stream": False
-    }
-
-    response = requests.post(OLLAMA_URL, json=payload)
-    response.raise_for_status()
-    return response.json()["response"]
+    return load_model("qa").generate_response(prompt)
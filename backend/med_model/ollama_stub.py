@@ -0,0 +1,88 @@
+import json
+import time
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Sequence
+
+# A minimal stand-in for an Ollama node (/api/generate and /api/ps), for exercising the
+# backend pool, retries and hedging without real models:
+#   python -m backend.med_model.ollama_stub --port 11435 --delay 0.5 --models OussamaELALLAM/MedExpert
+
+
+def make_handler(reply: str, delay: float, models: Sequence[str], load_delay: float):
+    resident = set(models)
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        served = 0
+
+        def log_message(self, *args):
+            pass
+
+        def _json(self, body, status=200):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            try:
+                self.wfile.write(data)
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # the client gave up (timeout or cancelled hedge)
+
+        def do_GET(self):
+            if self.path != "/api/ps":
+                return self._json({"error": "not found"}, 404)
+            with lock:
+                self._json({"models": [{"name": f"{name}:latest"} for name in sorted(resident)]})
+
+        def do_POST(self):
+            if self.path != "/api/generate":
+                return self._json({"error": "not found"}, 404)
+            payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            with lock:
+                cold = payload["model"] not in resident
+                resident.add(payload["model"])
+                Handler.served += 1
+            time.sleep(delay + (load_delay if cold else 0.0))
+            words = reply.split(" ")
+            final = {"done": True, "eval_count": len(words), "prompt_eval_count": len(payload["prompt"].split()),
+                     "total_duration": int(delay * 1e9)}
+            if not payload.get("stream", True):
+                return self._json({"response": reply, **final})
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.end_headers()
+            try:
+                for i, word in enumerate(words):
+                    chunk = (" " if i else "") + word
+                    self.wfile.write((json.dumps({"response": chunk, "done": False}) + "\n").encode())
+                    self.wfile.flush()
+                self.wfile.write((json.dumps({"response": "", **final}) + "\n").encode())
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # the client stopped reading early
+
+    return Handler
+
+
+def run_stub(port: int, reply: str = "Yes", delay: float = 0.0, models: Sequence[str] = (),
+             load_delay: float = 0.0, background: bool = True) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(reply, delay, models, load_delay))
+    if background:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    else:
+        server.serve_forever()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stub Ollama backend for local load-balancing tests")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--reply", default="Yes")
+    parser.add_argument("--delay", type=float, default=0.0, help="seconds per request")
+    parser.add_argument("--load-delay", type=float, default=0.0, help="extra seconds the first time a model is used")
+    parser.add_argument("--models", nargs="*", default=[], help="models resident at startup")
+    args = parser.parse_args()
+    print(f"Stub Ollama listening on http://127.0.0.1:{args.port}")
+    run_stub(args.port, args.reply, args.delay, args.models, args.load_delay, background=False)
@@ -0,0 +1,107 @@
+import re
+import string
+import textwrap
+import threading
+from typing import Dict, Optional, Sequence
+from backend.med_model.consultation import current_consultation
+
+# Rough stand-in for the model tokenizer: words, punctuation, newlines and indentation runs
+# each cost about one token, which is what matters when comparing prompt layouts.
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]|\n| {2,}")
+_BLANK_RUN_RE = re.compile(r"\n{3,}")
+TRUNCATION_MARKER = " …[truncated]"
+MIN_FIELD_TOKENS = 32
+
+# Per-task prompt budgets (tokens, as counted above).
+PROMPT_BUDGETS = {
+    "diagnosis": 1500,
+    "treatment": 2000,
+    "specialist": 2000,
+    "intent": 800,
+    "safety": 2500,
+    "triage": 1000
+}
+
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def count_tokens(text: str) -> int:
+    return len(_TOKEN_RE.findall(text))
+
+
+_MARKER_TOKENS = count_tokens(TRUNCATION_MARKER)
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    for i, match in enumerate(_TOKEN_RE.finditer(text)):
+        if i == max_tokens:
+            return text[:match.start()].rstrip() + TRUNCATION_MARKER
+    return text
+
+
+def normalize_prompt(text: str) -> str:
+    # Dedent, then keep at most two spaces of indentation per line: nested bullets stay
+    # readable to the model without paying for a dozen leading spaces each.
+    lines = []
+    for line in textwrap.dedent(text).strip("\n").splitlines():
+        stripped = line.lstrip(" ")
+        indent = len(line) - len(stripped)
+        lines.append(("  " if indent else "") + stripped.rstrip())
+    return _BLANK_RUN_RE.sub("\n\n", "\n".join(lines)).strip() + "\n"
+
+
+class PromptTemplate:
+    def __init__(self, name: str, text: str, task: Optional[str] = None,
+                 truncatable: Sequence[str] = (), track: bool = True):
+        self.name = name
+        # Fragments rendered into a larger prompt set track=False so they aren't counted twice.
+        self.track = track
+        self.agent = name.split(".", 1)[0]
+        self.text = normalize_prompt(text)
+        self.budget = PROMPT_BUDGETS.get(task) if task else None
+        # Fields that may be shortened, in the order they are sacrificed.
+        self.truncatable = tuple(truncatable)
+        self.fields = [field for _, field, _, _ in string.Formatter().parse(self.text) if field]
+        self._static_tokens = count_tokens(self.text.format_map({field: "" for field in self.fields}))
+        self._saved_per_render = count_tokens(text.format_map({field: "" for field in self.fields})) - self._static_tokens
+
+    def render(self, **fields) -> str:
+        values = {field: "" if fields.get(field) is None else str(fields[field]) for field in self.fields}
+        consultation = current_consultation()
+        if consultation is not None:
+            # The model already holds the patient text in its carried context or system prefix.
+            values = {field: consultation.reference(value) for field, value in values.items()}
+        sizes = {field: count_tokens(value) for field, value in values.items()}
+        total = self._static_tokens + sum(sizes.values())
+        truncated = 0
+
+        if self.budget and total > self.budget:
+            for field in self.truncatable:
+                overflow = total - self.budget
+                if overflow <= 0:
+                    break
+                keep = max(MIN_FIELD_TOKENS, sizes[field] - overflow - _MARKER_TOKENS)
+                if keep >= sizes[field]:
+                    continue
+                values[field] = truncate_tokens(values[field], keep)
+                truncated += sizes[field] - keep - _MARKER_TOKENS
+                total -= sizes[field] - keep - _MARKER_TOKENS
+
+        if self.track:
+            _record(self.agent, total, self._saved_per_render + truncated, truncated)
+        return self.text.format_map(values)
+
+
+def _record(agent: str, tokens: int, saved: int, truncated: int):
+    with _stats_lock:
+        stats = _stats.setdefault(agent, {"renders": 0, "tokens": 0, "tokens_saved": 0, "tokens_truncated": 0})
+        stats["renders"] += 1
+        stats["tokens"] += tokens
+        stats["tokens_saved"] += saved
+        stats["tokens_truncated"] += truncated
+
+
+def prompt_stats() -> Dict[str, Dict[str, int]]:
+    with _stats_lock:
+        return {agent: dict(stats) for agent, stats in _stats.items()}
@@ -0,0 +1,198 @@
+import time
+import random
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional, TypeVar
+import requests
+
+T = TypeVar("T")
+
+# Connect quickly or not at all; the read timeout comes from the task's deadline.
+CONNECT_TIMEOUT = 3.05
+DEFAULT_DEADLINE = 120.0
+MAX_RETRIES = 2
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 8.0
+# Statuses Ollama returns while overloaded or still loading a model.
+TRANSIENT_STATUSES = {429, 502, 503, 504}
+
+FAILURE_THRESHOLD = 5
+RESET_SECONDS = 30.0
+# A read timeout that ends within this much of the workflow deadline was cut short by the
+# caller, not by the backend.
+CLIENT_DEADLINE_SLACK = 0.05
+
+
+class BackendUnavailable(requests.ConnectionError):
+    # A ConnectionError subclass, so callers already handling network errors treat it the same way.
+    pass
+
+
+class DeadlineExceeded(requests.Timeout):
+    pass
+
+
+_local = threading.local()
+
+
+def current_deadline() -> Optional[float]:
+    # Absolute time.monotonic() by which the current workflow must finish, if any.
+    return getattr(_local, "deadline", None)
+
+
+@contextmanager
+def deadline_scope(expires: Optional[float]):
+    # Every model call on this thread inside the block is cut off at `expires`. Nested
+    # scopes can only tighten the deadline, never extend it.
+    previous = current_deadline()
+    if expires is not None and (previous is None or expires < previous):
+        _local.deadline = expires
+    try:
+        yield
+    finally:
+        _local.deadline = previous
+
+
+def time_remaining() -> Optional[float]:
+    deadline = current_deadline()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def effective_deadline(seconds: float) -> float:
+    remaining = time_remaining()
+    if remaining is None:
+        return seconds
+    if remaining <= 0:
+        raise DeadlineExceeded("Workflow deadline exceeded before the model call")
+    return min(seconds, remaining)
+
+
+class CircuitBreaker:
+    # closed: calls flow. open: calls fail immediately until RESET_SECONDS pass.
+    # half_open: one probe call is let through; its outcome closes or re-opens the breaker.
+    def __init__(self, name: str, failure_threshold: int = FAILURE_THRESHOLD, reset_seconds: float = RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.rejected = 0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def is_open(self) -> bool:
+        # True while calls would be rejected outright; a breaker due for a probe is not open.
+        with self._lock:
+            return self.state == "open" and time.monotonic() - self.opened_at < self.reset_seconds
+
+    def check(self):
+        with self._lock:
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_seconds:
+                self.state = "half_open"
+            if self.state == "closed":
+                return
+            if self.state == "half_open" and not self._probing:
+                self._probing = True
+                return
+            self.rejected += 1
+            raise BackendUnavailable(f"Model backend {self.name} is unavailable (circuit {self.state})")
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self._probing = False
+
+    def record_abandoned(self):
+        # The call ended without saying anything about the backend; a probe is simply retried.
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                self.state = "open"
+                self.opened_at = time.monotonic()
+            self._probing = False
+
+    def snapshot(self) -> Dict[str, object]:
+        with self._lock:
+            retry_in = max(0.0, self.reset_seconds - (time.monotonic() - self.opened_at)) if self.state == "open" else 0.0
+            return {"state": self.state, "failures": self.failures, "rejected": self.rejected, "retry_in": retry_in}
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def breaker_for(name: str) -> CircuitBreaker:
+    with _breakers_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(name)
+        return _breakers[name]
+
+
+def breaker_states() -> Dict[str, Dict[str, object]]:
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return {breaker.name: breaker.snapshot() for breaker in breakers}
+
+
+def is_transient(error: Exception) -> bool:
+    if isinstance(error, (requests.ConnectionError, requests.Timeout)):
+        return not isinstance(error, BackendUnavailable)
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        return error.response.status_code in TRANSIENT_STATUSES
+    return False
+
+
+def bounded_by_deadline(read_timeout: float) -> bool:
+    # True when the workflow deadline, not the backend's own timeout, set read_timeout.
+    remaining = time_remaining()
+    return remaining is not None and remaining <= read_timeout + CLIENT_DEADLINE_SLACK
+
+
+def guarded_call(breaker: CircuitBreaker, fn: Callable[[], T], client_bound: bool = False) -> T:
+    # client_bound: the read timeout is the caller's deadline, so a read timeout only means
+    # the caller ran out of time and is not held against the backend.
+    breaker.check()
+    try:
+        result = fn()
+    except requests.RequestException as e:
+        if client_bound and isinstance(e, requests.ReadTimeout):
+            breaker.record_abandoned()
+        elif is_transient(e):
+            breaker.record_failure()
+        else:
+            # The server answered; a bad request says nothing about its health.
+            breaker.record_success()
+        raise
+    except BaseException:
+        # Anything else (a parse error, an interrupt) is not the backend's fault, but it must
+        # still clear a half-open probe or the breaker would reject every later call.
+        breaker.record_abandoned()
+        raise
+    breaker.record_success()
+    return result
+
+
+def call_with_retry(send: Callable[[float], T], deadline: Optional[float] = None,
+                    max_retries: int = MAX_RETRIES) -> T:
+    # send(read_timeout) performs one attempt and must raise for bad statuses. Retries use
+    # full-jitter exponential backoff and never run past the overall deadline.
+    deadline = deadline or DEFAULT_DEADLINE
+    expires = time.monotonic() + deadline
+    attempt = 0
+    while True:
+        try:
+            return send(max(expires - time.monotonic(), 0.1))
+        except requests.RequestException as e:
+            if not is_transient(e):
+                raise
+            delay = random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+            attempt += 1
+            if attempt > max_retries or time.monotonic() + delay >= expires:
+                raise
+            time.sleep(delay)
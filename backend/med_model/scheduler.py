@@ -0,0 +1,175 @@
+import os
+import time
+import itertools
+import threading
+from contextlib import contextmanager
+from typing import Dict, Optional
+from backend.med_model.backends import BACKEND_URLS
+from backend.med_model.resilience import DeadlineExceeded
+
+# Lower value = served first.
+PRIORITY_CLASSES = {
+    "emergency": 0,
+    "diagnosis": 1,
+    "treatment": 2,
+    "chat": 3,
+    "batch": 4
+}
+
+TASK_PRIORITIES = {
+    "diagnosis": "diagnosis",
+    "treatment": "treatment",
+    "monitoring": "chat",
+    "report": "chat",
+    "qa": "chat"
+}
+
+URGENCY_PRIORITIES = {
+    "emergency": "emergency",
+    "immediate": "emergency",
+    "high": "diagnosis",
+    "urgent": "diagnosis"
+}
+
+# Ollama serves OLLAMA_NUM_PARALLEL requests per loaded model on each backend; anything beyond that
+# just queues server-side.
+MAX_CONCURRENCY = int(os.environ.get("OLLAMA_NUM_PARALLEL", "1")) * len(BACKEND_URLS)
+# A waiting request gains one priority class per AGING_SECONDS, so batch work is never starved.
+AGING_SECONDS = 30.0
+
+_local = threading.local()
+
+
+def priority_for_urgency(urgency: Optional[str]) -> Optional[str]:
+    if not urgency:
+        return None
+    return URGENCY_PRIORITIES.get(str(urgency).strip().lower())
+
+
+def current_priority() -> Optional[str]:
+    return getattr(_local, "priority", None)
+
+
+@contextmanager
+def priority_scope(priority: Optional[str]):
+    # Every LLM call made on this thread inside the block is scheduled with `priority`.
+    previous = current_priority()
+    if priority is not None:
+        _local.priority = priority
+    try:
+        yield
+    finally:
+        _local.priority = previous
+
+
+def resolve_priority(task_type: Optional[str], priority: Optional[str] = None) -> str:
+    return priority or current_priority() or TASK_PRIORITIES.get(task_type, "chat")
+
+
+class _Ticket:
+    __slots__ = ("priority", "seq", "enqueued")
+
+    def __init__(self, priority: str, seq: int):
+        self.priority = priority
+        self.seq = seq
+        self.enqueued = time.monotonic()
+
+
+class LLMScheduler:
+    def __init__(self, max_concurrency: int = MAX_CONCURRENCY, aging_seconds: float = AGING_SECONDS):
+        self.max_concurrency = max(1, max_concurrency)
+        self.aging_seconds = aging_seconds
+        self._cond = threading.Condition()
+        self._waiting = []
+        self._active = 0
+        self._seq = itertools.count()
+        self._metrics = {
+            name: {"submitted": 0, "completed": 0, "expired": 0, "total_wait": 0.0, "max_wait": 0.0}
+            for name in PRIORITY_CLASSES
+        }
+
+    def _rank(self, ticket: _Ticket, now: float):
+        waited = now - ticket.enqueued
+        return PRIORITY_CLASSES[ticket.priority] - waited / self.aging_seconds, ticket.seq
+
+    def _next(self) -> _Ticket:
+        # The queue is at most a few hundred entries; a scan keeps aging exact without re-heapifying.
+        now = time.monotonic()
+        return min(self._waiting, key=lambda ticket: self._rank(ticket, now))
+
+    def acquire(self, priority: str, timeout: Optional[float] = None) -> float:
+        # timeout bounds the queue wait (normally the workflow's remaining time); a request
+        # that cannot get a slot in time gives up its place instead of running late.
+        if priority not in PRIORITY_CLASSES:
+            raise ValueError(f"Unknown priority class: {priority}")
+        with self._cond:
+            ticket = _Ticket(priority, next(self._seq))
+            expires = None if timeout is None else ticket.enqueued + timeout
+            self._waiting.append(ticket)
+            self._metrics[priority]["submitted"] += 1
+            while self._active >= self.max_concurrency or self._next() is not ticket:
+                wait = self.aging_seconds if expires is None else min(self.aging_seconds, expires - time.monotonic())
+                if wait <= 0:
+                    self._waiting.remove(ticket)
+                    self._metrics[priority]["expired"] += 1
+                    self._cond.notify_all()
+                    raise DeadlineExceeded(f"No model slot free within the {timeout:.1f}s left for this workflow")
+                self._cond.wait(timeout=wait)
+            self._waiting.remove(ticket)
+            self._active += 1
+            wait = time.monotonic() - ticket.enqueued
+            metrics = self._metrics[priority]
+            metrics["total_wait"] += wait
+            metrics["max_wait"] = max(metrics["max_wait"], wait)
+            # Another slot may still be free for the next ticket in line.
+            self._cond.notify_all()
+            return wait
+
+    def try_acquire(self, priority: str) -> bool:
+        # Takes a slot only if one is free and nobody is queued for it: for optional extra
+        # work (a hedged request) that should never delay anyone else.
+        if priority not in PRIORITY_CLASSES:
+            raise ValueError(f"Unknown priority class: {priority}")
+        with self._cond:
+            if self._active >= self.max_concurrency or self._waiting:
+                return False
+            self._active += 1
+            self._metrics[priority]["submitted"] += 1
+            return True
+
+    def release(self, priority: str):
+        with self._cond:
+            self._active -= 1
+            self._metrics[priority]["completed"] += 1
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, priority: str, timeout: Optional[float] = None):
+        self.acquire(priority, timeout)
+        try:
+            yield
+        finally:
+            self.release(priority)
+
+    def stats(self) -> Dict[str, object]:
+        with self._cond:
+            depth = {name: 0 for name in PRIORITY_CLASSES}
+            for ticket in self._waiting:
+                depth[ticket.priority] += 1
+            classes = {}
+            for name, metrics in self._metrics.items():
+                served = metrics["submitted"] - metrics["expired"] - depth[name]
+                classes[name] = {
+                    **metrics,
+                    "queued": depth[name],
+                    "avg_wait": metrics["total_wait"] / served if served else 0.0
+                }
+            return {
+                "active": self._active,
+                "max_concurrency": self.max_concurrency,
+                "queue_depth": len(self._waiting),
+                "classes": classes
+            }
+
+
+scheduler = LLMScheduler()
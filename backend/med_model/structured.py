@@ -0,0 +1,110 @@
+import json
+import threading
+from typing import Dict, List, Optional
+
+_TYPES = {
+    "object": dict,
+    "array": list,
+    "string": str,
+    "boolean": bool,
+    "integer": int,
+    "number": (int, float)
+}
+
+
+def validate_schema(value, schema: Dict, path: str = "$") -> List[str]:
+    # Covers the JSON-schema subset our agent schemas use: type, required, properties, items, enum.
+    errors = []
+    expected = schema.get("type")
+    if expected:
+        python_type = _TYPES[expected]
+        # bool is an int subclass; don't let true/false pass as numbers.
+        if not isinstance(value, python_type) or (expected in ("integer", "number") and isinstance(value, bool)):
+            return [f"{path}: expected {expected}, got {type(value).__name__}"]
+    if "enum" in schema and value not in schema["enum"]:
+        errors.append(f"{path}: {value!r} not in {schema['enum']}")
+    if expected == "object":
+        for key in schema.get("required", []):
+            if key not in value:
+                errors.append(f"{path}.{key}: missing")
+        for key, subschema in schema.get("properties", {}).items():
+            if key in value:
+                errors.extend(validate_schema(value[key], subschema, f"{path}.{key}"))
+    if expected == "array" and "items" in schema:
+        for i, item in enumerate(value):
+            errors.extend(validate_schema(item, schema["items"], f"{path}[{i}]"))
+    return errors
+
+
+class JSONObjectExtractor:
+    # Incrementally scans streamed text for the first complete top-level JSON object,
+    # so the caller can stop generation the moment it closes.
+    def __init__(self):
+        self._buffer = []
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self.result = None
+
+    def feed(self, chunk: str) -> Optional[str]:
+        if self.result is not None:
+            return self.result
+        for char in chunk:
+            if self._depth == 0:
+                if char != "{":
+                    continue  # prose before the object
+                self._buffer = []
+            self._buffer.append(char)
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char == "{":
+                self._depth += 1
+            elif char == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    self.result = "".join(self._buffer)
+                    return self.result
+        return None
+
+
+_parse_stats = {}
+_parse_lock = threading.Lock()
+
+
+def _record_parse(label: str, outcome: str):
+    with _parse_lock:
+        stats = _parse_stats.setdefault(label, {"ok": 0, "no_json": 0, "invalid_json": 0, "schema": 0})
+        stats[outcome] += 1
+
+
+def parse_json_object(text: Optional[str], schema: Optional[Dict] = None, label: str = "default") -> Dict:
+    if text is None:
+        _record_parse(label, "no_json")
+        raise ValueError("No JSON object in response")
+    try:
+        result = json.loads(text)
+    except json.JSONDecodeError as e:
+        _record_parse(label, "invalid_json")
+        raise ValueError(f"Invalid JSON in response: {e}") from e
+    errors = validate_schema(result, schema) if schema else []
+    if errors:
+        _record_parse(label, "schema")
+        raise ValueError(f"Response does not match schema: {'; '.join(errors)}")
+    _record_parse(label, "ok")
+    return result
+
+
+def parse_stats() -> Dict[str, Dict[str, float]]:
+    with _parse_lock:
+        report = {}
+        for label, stats in _parse_stats.items():
+            total = sum(stats.values())
+            report[label] = {**stats, "failure_rate": (total - stats["ok"]) / total if total else 0.0}
+        return report
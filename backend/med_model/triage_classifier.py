@@ -0,0 +1,383 @@
+import os
+import re
+import json
+import time
+import hashlib
+import argparse
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Optional, Tuple
+
+ARTIFACT_PATH = os.path.join(os.path.dirname(__file__), "triage_classifier.json")
+RELEVANT_LOG = "backend/logs/relevant_diagnosis.csv"
+IRRELEVANT_LOG = "backend/logs/irrelevant_responses.csv"
+
+MAX_FEATURES = 3000
+# Below this probability the caller falls back to the LLM. Training calibrates a per-model
+# threshold on out-of-fold predictions; this is its floor and the default for older artifacts.
+CONFIDENCE_THRESHOLD = 0.85
+# The labeled set is small, so thresholds are calibrated by cross-validation over all of it
+# rather than on a fixed held-out slice. Folds are chosen by text hash, so they are stable
+# across retrains.
+CV_FOLDS = 5
+# Confident out-of-fold predictions must be at least this precise, over at least
+# MIN_CONFIDENT of them.
+TARGET_PRECISION = 0.95
+MIN_CONFIDENT = 5
+
+INTENT_LABELS = ["diagnosis", "treatment", "monitoring", "reporting", "emergency", "general"]
+
+# Seed examples so both models have every class before the logs contain it.
+SEED_RELEVANCE = {
+    True: [
+        "I have had a fever and sore throat for three days",
+        "sharp chest pain when breathing and shortness of breath",
+        "my child has a rash and itchy skin on the arms",
+        "persistent headache with nausea and blurred vision",
+        "what dose of ibuprofen is safe with high blood pressure",
+        "blood sugar readings have been high since starting metformin",
+        "feeling dizzy and fatigued after meals",
+        "severe abdominal pain and vomiting since last night",
+        # The irrelevant log is mostly first-person chat, so short first-person complaints
+        # are needed to keep "I ..." from reading as off-topic.
+        "my back hurts what should I do",
+        "I need to see a doctor about my shoulder",
+        "I feel tired all day and my stomach hurts",
+        "my ankle is swollen after I twisted it",
+        "I keep coughing at night",
+        "is it normal that my knee clicks and aches"
+    ],
+    False: [
+        "what is the best laptop for programming",
+        "recommend a good movie for the weekend",
+        "how do I fix my car engine",
+        "write me a poem about the ocean",
+        "what is the capital of france",
+        "help me plan a road trip with friends",
+        "how can I get a job in software engineering",
+        "what time does the football match start"
+    ]
+}
+
+SEED_INTENTS = {
+    "diagnosis": [
+        "I have a cough and fever, what could it be",
+        "what is causing my joint pain and swelling",
+        "headache and stiff neck for two days",
+        "I feel tired all the time and lost weight"
+    ],
+    "treatment": [
+        "what medication should I take for migraine",
+        "how should I treat a sprained ankle",
+        "what is the treatment for type 2 diabetes",
+        "which antibiotic is used for strep throat"
+    ],
+    "monitoring": [
+        "show my heart rate trend this week",
+        "how have my vitals changed since last month",
+        "track my blood pressure readings",
+        "is my temperature getting better over time"
+    ],
+    "reporting": [
+        "generate a medical report for my visit",
+        "create a summary report of my diagnosis",
+        "export my treatment plan as a report",
+        "I need a written report for my doctor"
+    ],
+    "emergency": [
+        "crushing chest pain radiating to my left arm",
+        "I can't breathe and my lips are turning blue",
+        "sudden weakness on one side of my face and slurred speech",
+        "he is unconscious and not breathing"
+    ],
+    "general": [
+        "hello",
+        "what can you do",
+        "tell me about this app",
+        "thanks for the help"
+    ]
+}
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_artifact = None
+
+
+def _tokenize(text: str) -> List[str]:
+    words = _TOKEN_RE.findall(str(text).lower())
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+def _clean_log_rows(texts) -> List[str]:
+    # The relevant log has treatment bullet lines spilled into the Symptoms column.
+    cleaned = []
+    for text in texts.dropna().astype(str):
+        text = text.strip()
+        if len(text) < 15 or re.match(r"^(-|\*|\d+\.)", text):
+            continue
+        cleaned.append(text)
+    return list(dict.fromkeys(cleaned))
+
+
+def load_training_data() -> Tuple[List[str], List[bool], List[str], List[str]]:
+    relevant = _clean_log_rows(pd.read_csv(RELEVANT_LOG)["Symptoms"]) if os.path.exists(RELEVANT_LOG) else []
+    irrelevant = _clean_log_rows(pd.read_csv(IRRELEVANT_LOG)["Symptoms"]) if os.path.exists(IRRELEVANT_LOG) else []
+    conflicting = set(relevant) & set(irrelevant)
+    relevant = [t for t in relevant if t not in conflicting] + SEED_RELEVANCE[True]
+    irrelevant = [t for t in irrelevant if t not in conflicting] + SEED_RELEVANCE[False]
+
+    relevance_texts = relevant + irrelevant
+    relevance_labels = [True] * len(relevant) + [False] * len(irrelevant)
+
+    # Logged consultations all went through the diagnosis workflow.
+    intent_texts = relevant[:len(relevant) - len(SEED_RELEVANCE[True])]
+    intent_labels = ["diagnosis"] * len(intent_texts)
+    for label, examples in SEED_INTENTS.items():
+        intent_texts += examples
+        intent_labels += [label] * len(examples)
+    return relevance_texts, relevance_labels, intent_texts, intent_labels
+
+
+def _fold(text: str) -> int:
+    return int(hashlib.sha1(text.encode("utf-8")).hexdigest(), 16) % CV_FOLDS
+
+
+def out_of_fold(texts: List[str], labels: List[str]) -> List[Tuple[str, str, Optional[Tuple[str, float]]]]:
+    # (text, label, prediction) for every row, each predicted by a model fit without its fold.
+    # A class with no rows left outside a fold is still predicted from the rows it has there.
+    folds = [_fold(text) for text in texts]
+    scored = []
+    for fold in range(CV_FOLDS):
+        train_rows = [(t, l) for t, l, f in zip(texts, labels, folds) if f != fold]
+        test_rows = [(t, l) for t, l, f in zip(texts, labels, folds) if f == fold]
+        if not test_rows:
+            continue
+        model = _compile(_fit([t for t, _ in train_rows], [l for _, l in train_rows]))
+        scored += [(text, label, _score(model, text)) for text, label in test_rows]
+    return scored
+
+
+def _fit(texts: List[str], labels: List[str], epochs: int = 1000, lr: float = 1.0, l2: float = 1e-4) -> Dict:
+    classes = sorted(set(labels))
+    docs = [_tokenize(text) for text in texts]
+    df_counts = {}
+    for tokens in docs:
+        for token in set(tokens):
+            df_counts[token] = df_counts.get(token, 0) + 1
+    vocab = sorted(df_counts, key=lambda t: (-df_counts[t], t))[:MAX_FEATURES]
+    index = {token: i for i, token in enumerate(vocab)}
+    idf = np.log((1 + len(docs)) / (1 + np.array([df_counts[t] for t in vocab]))) + 1
+
+    X = np.zeros((len(docs), len(vocab)))
+    for row, tokens in enumerate(docs):
+        for token in tokens:
+            if token in index:
+                X[row, index[token]] += 1
+    X *= idf
+    X /= np.maximum(np.linalg.norm(X, axis=1, keepdims=True), 1e-12)
+
+    y = np.array([classes.index(label) for label in labels])
+    Y = np.eye(len(classes))[y]
+    # Balanced class weights: the irrelevant log is much smaller than the relevant one.
+    sample_weight = (len(y) / (len(classes) * np.bincount(y, minlength=len(classes))))[y][:, None]
+
+    W = np.zeros((len(vocab), len(classes)))
+    b = np.zeros(len(classes))
+    for _ in range(epochs):
+        logits = X @ W + b
+        logits -= logits.max(axis=1, keepdims=True)
+        P = np.exp(logits)
+        P /= P.sum(axis=1, keepdims=True)
+        grad = (P - Y) * sample_weight / len(y)
+        W -= lr * (X.T @ grad + l2 * W)
+        b -= lr * grad.sum(axis=0)
+
+    return {
+        "classes": [str(c) for c in classes],
+        "vocab": vocab,
+        "idf": np.round(idf, 4).tolist(),
+        "weights": np.round(W, 4).tolist(),
+        "bias": np.round(b, 4).tolist()
+    }
+
+
+def _calibrate(scored: List[Tuple[str, str, Optional[Tuple[str, float]]]], positive: Optional[str] = None) -> Dict:
+    # The lowest threshold at which out-of-fold predictions (only those of class `positive`,
+    # if given) reach TARGET_PRECISION. Without any such threshold the model never answers.
+    candidates = [(prediction, label) for _, label, prediction in scored
+                  if prediction is not None and (positive is None or prediction[0] == positive)]
+    threshold = 1.01
+    for candidate in sorted({max(p, CONFIDENCE_THRESHOLD) for (_, p), _ in candidates}):
+        confident = [prediction[0] == label for prediction, label in candidates if prediction[1] >= candidate]
+        if len(confident) >= MIN_CONFIDENT and sum(confident) / len(confident) >= TARGET_PRECISION:
+            threshold = candidate
+            break
+    confident = [prediction[0] == label for prediction, label in candidates if prediction[1] >= threshold]
+    return {
+        "threshold": threshold,
+        "cross_validation": {
+            "folds": CV_FOLDS,
+            "samples": len(scored),
+            "coverage": len(confident) / len(scored) if scored else 0.0,
+            "precision": sum(confident) / len(confident) if confident else None
+        }
+    }
+
+
+def train(artifact_path: str = ARTIFACT_PATH) -> Dict:
+    relevance_texts, relevance_labels, intent_texts, intent_labels = load_training_data()
+    relevance_labels = [str(label) for label in relevance_labels]
+    # The shipped models are fit on every labeled row; their thresholds come from models fit
+    # the same way on all but one fold, scored on that fold.
+    relevance = _fit(relevance_texts, relevance_labels)
+    relevance.update(_calibrate(out_of_fold(relevance_texts, relevance_labels), positive="True"))
+    intent = _fit(intent_texts, intent_labels)
+    intent.update(_calibrate(out_of_fold(intent_texts, intent_labels)))
+    artifact = {
+        "relevance": relevance,
+        "intent": intent,
+        "trained_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "samples": {"relevance": len(relevance_texts), "intent": len(intent_texts)}
+    }
+    with open(artifact_path, "w", encoding="utf-8") as f:
+        json.dump(artifact, f, separators=(",", ":"))
+    global _artifact
+    _artifact = None
+    return artifact
+
+
+def _compile(model: Dict) -> Dict:
+    return {
+        "classes": model["classes"],
+        "index": {token: i for i, token in enumerate(model["vocab"])},
+        "idf": np.array(model["idf"]),
+        "weights": np.array(model["weights"]),
+        "bias": np.array(model["bias"]),
+        "threshold": model.get("threshold", CONFIDENCE_THRESHOLD)
+    }
+
+
+def _load() -> Optional[Dict]:
+    global _artifact
+    if _artifact is None and os.path.exists(ARTIFACT_PATH):
+        with open(ARTIFACT_PATH, encoding="utf-8") as f:
+            raw = json.load(f)
+        _artifact = {name: _compile(raw[name]) for name in ("relevance", "intent")}
+    return _artifact
+
+
+def _predict(name: str, text: str) -> Optional[Tuple[str, float]]:
+    artifact = _load()
+    if artifact is None:
+        return None
+    return _score(artifact[name], text)
+
+
+def _threshold(name: str, threshold: Optional[float]) -> float:
+    if threshold is not None:
+        return threshold
+    artifact = _load()
+    return artifact[name]["threshold"] if artifact else CONFIDENCE_THRESHOLD
+
+
+def _score(model: Dict, text: str) -> Optional[Tuple[str, float]]:
+    counts = {}
+    for token in _tokenize(text):
+        i = model["index"].get(token)
+        if i is not None:
+            counts[i] = counts.get(i, 0) + 1
+    if not counts:
+        return None
+    ids = np.fromiter(counts, dtype=int)
+    values = np.fromiter(counts.values(), dtype=float) * model["idf"][ids]
+    values /= np.linalg.norm(values)
+    logits = values @ model["weights"][ids] + model["bias"]
+    probs = np.exp(logits - logits.max())
+    probs /= probs.sum()
+    best = int(probs.argmax())
+    return model["classes"][best], float(probs[best])
+
+
+def predict_relevance(text: str, threshold: Optional[float] = None) -> Optional[bool]:
+    # True, or None meaning "ask the LLM". Only confident positives are trusted: the
+    # irrelevant log is short first-person chat, which real patient messages resemble, so a
+    # confident "not medical" is not reliable enough to turn a user away.
+    prediction = _predict("relevance", text)
+    if prediction is None or prediction[0] != "True" or prediction[1] < _threshold("relevance", threshold):
+        return None
+    return True
+
+
+def predict_intent(text: str, threshold: Optional[float] = None) -> Optional[str]:
+    prediction = _predict("intent", text)
+    if prediction is None or prediction[1] < _threshold("intent", threshold):
+        return None
+    return prediction[0]
+
+
+def evaluate_against_llm(limit: int = 50, threshold: Optional[float] = None,
+                         use_llm: bool = True) -> Dict[str, Dict[str, float]]:
+    # Scores both models out of fold (each row predicted by a model that did not see it) at
+    # the shipped thresholds: against the labels and, with use_llm, against the LLM answer
+    # the classifier stands in for.
+    llm = {}
+    if use_llm:
+        from backend.agents import diagnosis_agent
+        from backend.agents.orchestrator_agent import MedicalOrchestrator
+        orchestrator = MedicalOrchestrator(diagnosis_agent.med_model)
+        llm = {"relevance": lambda text: str(diagnosis_agent.is_input_medical_llm(text)),
+               "intent": lambda text: orchestrator.analyze_query_intent_llm(text).get("intent")}
+
+    relevance_texts, relevance_labels, intent_texts, intent_labels = load_training_data()
+    data = {"relevance": (relevance_texts, [str(label) for label in relevance_labels], "True"),
+            "intent": (intent_texts, intent_labels, None)}
+    report = {}
+    for name, (texts, labels, positive) in data.items():
+        cutoff = _threshold(name, threshold)
+        started = time.perf_counter()
+        scored = out_of_fold(texts, labels)[:limit]
+        elapsed = time.perf_counter() - started
+        confident = correct = agreed = 0
+        for text, label, prediction in scored:
+            if prediction is None or prediction[1] < cutoff or (positive is not None and prediction[0] != positive):
+                continue
+            confident += 1
+            correct += prediction[0] == label
+            if name in llm:
+                agreed += prediction[0] == llm[name](text)
+        report[name] = {
+            "samples": len(scored),
+            "threshold": cutoff,
+            "coverage": confident / len(scored) if scored else 0.0,
+            "precision": correct / confident if confident else 0.0,
+            "llm_agreement": agreed / confident if confident and llm else None,
+            "cv_seconds": elapsed
+        }
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local relevance/intent triage classifier")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("train", help="Train from the diagnosis logs and write the artifact")
+    evaluate = commands.add_parser("eval", help="Score both models out of fold (and against the LLM)")
+    evaluate.add_argument("--limit", type=int, default=50)
+    evaluate.add_argument("--threshold", type=float, default=None, help="override the calibrated thresholds")
+    evaluate.add_argument("--offline", action="store_true", help="compare with the labels only, no LLM calls")
+
+    args = parser.parse_args(argv)
+    if args.command == "train":
+        artifact = train()
+        print(f"[Classifier] Trained on {artifact['samples']} samples -> {ARTIFACT_PATH}")
+        for name in ("relevance", "intent"):
+            print(f"[Classifier] {name}: threshold {artifact[name]['threshold']:.2f}, "
+                  f"cross-validation {artifact[name]['cross_validation']}")
+    elif args.command == "eval":
+        report = evaluate_against_llm(args.limit, args.threshold, use_llm=not args.offline)
+        for name, result in report.items():
+            agreement = "" if result["llm_agreement"] is None else f", LLM agreement {result['llm_agreement']:.0%}"
+            print(f"[Classifier] {name}: {result['samples']} out-of-fold samples, threshold {result['threshold']:.2f}, "
+                  f"coverage {result['coverage']:.0%}, precision {result['precision']:.0%}{agreement}")
+
+
+if __name__ == "__main__":
+    main()
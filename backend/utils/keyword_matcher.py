@@ -0,0 +1,193 @@
+import time
+import random
+import string
+from collections import deque
+from typing import Dict, Iterable, List, Tuple
+
+# Terms ending in "*" are stems: they only need a word boundary at the start ("vomit*" matches "vomiting").
+SPECIALTY_KEYWORDS = {
+    # Cardiac phrases outweigh any single comorbidity term, so "chest pain and diabetes"
+    # still routes to cardiology first.
+    "cardiology": {"chest": 1.0, "chest pain": 2.5, "chest pressure": 2.5, "chest tightness": 2.5,
+                   "heart": 1.5, "palpitation*": 2.0, "angina": 2.0, "arrhythmia*": 2.0},
+    "neurology": {"headache*": 1.5, "seizure*": 2.0, "numbness": 1.5, "dizz*": 1.0, "migraine*": 2.0},
+    "pharmacology": {"drug*": 1.0, "medication*": 1.0, "dose*": 1.5, "dosage": 1.5, "interaction*": 2.0},
+    "psychiatry": {"depress*": 2.0, "mood": 1.0, "anxiety": 2.0, "suicid*": 3.0, "sleep*": 0.5, "self harm": 3.0},
+    "pulmonology": {"cough*": 1.5, "asthma": 2.0, "breath*": 1.5, "wheez*": 2.0},
+    "gastroenterology": {"stomach*": 1.5, "nausea": 1.5, "vomit*": 1.5, "digest*": 1.0, "abdominal": 1.5, "diarrh*": 1.5},
+    "dermatology": {"rash*": 2.0, "skin": 1.5, "itch*": 1.5, "eczema": 2.0, "acne": 2.0},
+    "endocrinology": {"diabet*": 2.0, "thyroid": 2.0, "hormone*": 1.5, "insulin": 2.0, "glucose": 1.5}
+}
+
+SYNONYMS = {
+    "heart": ["cardiac"],
+    "breath*": ["dyspn*"],
+    "vomit*": ["throwing up", "emesis"],
+    "stomach*": ["tumm*", "belly"],
+    "itch*": ["prurit*"],
+    "diabet*": ["blood sugar"],
+    "headache*": ["head hurts", "cephalalgia"],
+    "palpitation*": ["racing heart", "heart racing"]
+}
+
+# General medical vocabulary used by qa_agent.is_medical_question.
+MEDICAL_KEYWORDS = [
+    "disease*", "disorder*", "infection*", "bacteria*", "virus*", "treatment*",
+    "symptom*", "cancer*", "arthritis", "diabetes", "antibiotic*", "fever*"
+]
+
+
+class KeywordMatcher:
+    def __init__(self):
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]
+        self._compiled = False
+
+    def add(self, term: str, label: str, weight: float = 1.0):
+        term = term.lower()
+        prefix = term.endswith("*")
+        term = term.rstrip("*")
+        state = 0
+        for char in term:
+            if char not in self._goto[state]:
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+                self._goto[state][char] = len(self._goto) - 1
+            state = self._goto[state][char]
+        self._output[state].append((term, len(term), prefix, label, weight))
+        self._compiled = False
+
+    def compile(self):
+        # Standard Aho-Corasick failure links, built breadth-first.
+        queue = deque(self._goto[0].values())
+        for state in queue:
+            self._fail[state] = 0
+        while queue:
+            state = queue.popleft()
+            for char, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[nxt] = self._goto[fallback].get(char, 0)
+                self._output[nxt] = self._output[nxt] + self._output[self._fail[nxt]]
+        self._compiled = True
+        return self
+
+    def find(self, text: str) -> Iterable[Tuple[str, str, float]]:
+        if not self._compiled:
+            self.compile()
+        text = text.lower()
+        goto, fail, output = self._goto, self._fail, self._output
+        state = 0
+        length = len(text)
+        for end, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for term, size, prefix, label, weight in output[state]:
+                start = end - size + 1
+                if start > 0 and text[start - 1].isalnum():
+                    continue
+                if not prefix and end + 1 < length and text[end + 1].isalnum():
+                    continue
+                yield term, label, weight
+
+    def scores(self, text: str) -> Dict[str, float]:
+        # Each distinct term counts once per label, so repeating a word does not inflate a score.
+        seen = set()
+        totals = {}
+        for term, label, weight in self.find(text):
+            if (term, label) in seen:
+                continue
+            seen.add((term, label))
+            totals[label] = totals.get(label, 0.0) + weight
+        return totals
+
+
+def build_medical_matcher(specialty_keywords=SPECIALTY_KEYWORDS, synonyms=SYNONYMS,
+                          medical_keywords=MEDICAL_KEYWORDS) -> KeywordMatcher:
+    matcher = KeywordMatcher()
+    for specialty, keywords in specialty_keywords.items():
+        for term, weight in keywords.items():
+            for variant in [term, *synonyms.get(term, [])]:
+                matcher.add(variant, specialty, weight)
+                matcher.add(variant, "medical", 1.0)
+    for term in medical_keywords:
+        matcher.add(term, "medical", 1.0)
+    return matcher.compile()
+
+
+medical_matcher = build_medical_matcher()
+
+
+def rank_specialties(text: str) -> List[Tuple[str, float]]:
+    scores = medical_matcher.scores(text)
+    ranked = [(specialty, scores[specialty]) for specialty in SPECIALTY_KEYWORDS if specialty in scores]
+    # sorted() is stable, so ties keep the SPECIALTY_KEYWORDS order.
+    return sorted(ranked, key=lambda item: -item[1])
+
+
+# (text, specialty that must rank first)
+ROUTING_CASES = [
+    ("I have chest pain and diabetes", "cardiology"),
+    ("Chest pressure when I climb stairs, I take insulin", "cardiology"),
+    ("My blood sugar is high and I feel thirsty", "endocrinology"),
+    ("Itchy rash on my arms", "dermatology")
+]
+
+
+def check_routing(cases=ROUTING_CASES) -> List[Tuple[str, str, List[Tuple[str, float]]]]:
+    # Returns the cases whose top-ranked specialty is not the expected one.
+    failures = []
+    for text, expected in cases:
+        ranked = rank_specialties(text)
+        if not ranked or ranked[0][0] != expected:
+            failures.append((text, expected, ranked))
+    return failures
+
+
+def benchmark(n_terms: int = 5000, n_texts: int = 200, text_words: int = 60, seed: int = 0) -> Dict[str, float]:
+    rng = random.Random(seed)
+
+    def word():
+        return "".join(rng.choices(string.ascii_lowercase, k=rng.randint(4, 9)))
+
+    terms = [word() for _ in range(n_terms)]
+    texts = [" ".join(rng.choice(terms) if rng.random() < 0.05 else word() for _ in range(text_words))
+             for _ in range(n_texts)]
+    matcher = KeywordMatcher()
+    for i, term in enumerate(terms):
+        matcher.add(term, f"label{i % 20}")
+    started = time.perf_counter()
+    matcher.compile()
+    compile_ms = 1000 * (time.perf_counter() - started)
+
+    started = time.perf_counter()
+    for text in texts:
+        matcher.scores(text)
+    automaton_ms = 1000 * (time.perf_counter() - started) / n_texts
+
+    # The loop determine_specialist_consultation used to run: one substring search per keyword.
+    started = time.perf_counter()
+    for text in texts:
+        lowered = text.lower()
+        [term for term in terms if term in lowered]
+    naive_ms = 1000 * (time.perf_counter() - started) / n_texts
+
+    return {"terms": n_terms, "compile_ms": compile_ms, "automaton_ms_per_text": automaton_ms,
+            "naive_ms_per_text": naive_ms}
+
+
+if __name__ == "__main__":
+    import sys
+    failures = check_routing()
+    for text, expected, ranked in failures:
+        print(f"MISROUTED (expected {expected}): {text} -> {ranked}")
+    for size in (50, 500, 5000):
+        result = benchmark(n_terms=size)
+        print(f"{result['terms']:>5} terms: automaton {result['automaton_ms_per_text']:.3f} ms/text, "
+              f"naive {result['naive_ms_per_text']:.3f} ms/text (compile {result['compile_ms']:.1f} ms)")
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,324 @@
+import re
+import threading
+from typing import Dict, List, Optional
+
+# Local pharmacology index for the treatment safety pre-check. Each drug is
+# name: (synonyms, classes, single dose range in mg, max daily dose in mg). A range of None
+# means the dose cannot be checked here; drugs in NARROW_THERAPEUTIC_INDEX always go to the
+# LLM validator even when nothing is flagged. Adult oral dosing.
+DRUG_INDEX = {
+    "acetaminophen": (["paracetamol", "tylenol", "panadol", "apap"], [], (325, 1000), 4000),
+    "ibuprofen": (["advil", "motrin", "nurofen"], ["nsaid"], (200, 800), 3200),
+    "naproxen": (["aleve", "naprosyn"], ["nsaid"], (220, 500), 1500),
+    "aspirin": (["acetylsalicylic acid", "asa"], ["nsaid", "antiplatelet"], (75, 1000), 4000),
+    "diclofenac": (["voltaren"], ["nsaid"], (25, 75), 150),
+    "celecoxib": (["celebrex"], ["nsaid"], (100, 400), 400),
+    "amoxicillin": (["amoxil"], ["antibiotic"], (250, 1000), 4000),
+    "azithromycin": (["zithromax", "z-pak"], ["antibiotic"], (250, 2000), 2000),
+    "clarithromycin": (["biaxin"], ["antibiotic", "cyp3a4_inhibitor"], (250, 500), 1000),
+    "doxycycline": (["vibramycin"], ["antibiotic"], (50, 200), 200),
+    "ciprofloxacin": (["cipro"], ["antibiotic", "inr_raising"], (250, 750), 1500),
+    "metronidazole": (["flagyl"], ["antibiotic", "inr_raising"], (250, 2000), 4000),
+    "trimethoprim-sulfamethoxazole": (["bactrim", "septra", "co-trimoxazole"], ["antibiotic", "inr_raising"], None, None),
+    "fluconazole": (["diflucan"], ["cyp3a4_inhibitor", "inr_raising"], (50, 400), 800),
+    "cetirizine": (["zyrtec"], ["antihistamine"], (5, 10), 10),
+    "loratadine": (["claritin"], ["antihistamine"], (10, 10), 10),
+    "diphenhydramine": (["benadryl"], ["antihistamine", "sedative"], (25, 50), 300),
+    "omeprazole": (["prilosec"], [], (10, 40), 80),
+    "famotidine": (["pepcid"], [], (10, 40), 80),
+    "ondansetron": (["zofran"], [], (4, 8), 24),
+    "loperamide": (["imodium"], [], (2, 4), 16),
+    "metformin": (["glucophage"], [], (500, 2000), 2550),
+    "lisinopril": (["zestril", "prinivil"], ["ace_inhibitor"], (2.5, 40), 80),
+    "spironolactone": (["aldactone"], ["potassium_sparing"], (12.5, 200), 400),
+    "amlodipine": (["norvasc"], [], (2.5, 10), 10),
+    "atorvastatin": (["lipitor"], ["statin"], (10, 80), 80),
+    "simvastatin": (["zocor"], ["statin"], (5, 40), 40),
+    "sertraline": (["zoloft"], ["ssri", "serotonergic"], (25, 200), 200),
+    "fluoxetine": (["prozac"], ["ssri", "serotonergic"], (10, 80), 80),
+    "escitalopram": (["lexapro"], ["ssri", "serotonergic"], (5, 20), 20),
+    "st john's wort": (["hypericum"], ["serotonergic"], None, None),
+    "sumatriptan": (["imitrex"], ["serotonergic"], (25, 100), 200),
+    "tramadol": (["ultram"], ["opioid", "serotonergic"], (50, 100), 400),
+    "codeine": ([], ["opioid"], (15, 60), 360),
+    "diazepam": (["valium"], ["benzodiazepine", "sedative"], (2, 10), 40),
+    "alprazolam": (["xanax"], ["benzodiazepine", "sedative"], (0.25, 2), 4),
+    "lorazepam": (["ativan"], ["benzodiazepine", "sedative"], (0.5, 2), 10),
+    "prednisone": (["deltasone"], ["corticosteroid"], (1, 80), 80),
+    "clopidogrel": (["plavix"], ["antiplatelet"], (75, 600), 600),
+    "apixaban": (["eliquis"], ["anticoagulant"], (2.5, 10), 20),
+    "rivaroxaban": (["xarelto"], ["anticoagulant"], (2.5, 20), 30),
+    "warfarin": (["coumadin", "jantoven"], ["anticoagulant"], (1, 10), 10),
+    "sildenafil": (["viagra"], ["pde5_inhibitor"], (25, 100), 100),
+    "tadalafil": (["cialis"], ["pde5_inhibitor"], (2.5, 20), 20),
+    "nitroglycerin": (["isosorbide", "nitrate"], ["nitrate"], None, None),
+    "lithium": ([], [], None, None),
+    "digoxin": (["lanoxin"], [], None, None),
+    "methotrexate": ([], [], None, None),
+    "insulin": ([], [], None, None)
+}
+NARROW_THERAPEUTIC_INDEX = {"warfarin", "lithium", "digoxin", "methotrexate", "insulin"}
+
+# Generic mentions ("avoid NSAIDs", "a blood thinner") resolve to their class only.
+CLASS_TERMS = {
+    "nsaid": "nsaid", "nsaids": "nsaid", "anti-inflammatory": "nsaid", "anti-inflammatories": "nsaid",
+    "blood thinner": "anticoagulant", "blood thinners": "anticoagulant", "anticoagulant": "anticoagulant",
+    "ssri": "ssri", "ssris": "ssri", "antidepressant": "ssri", "antidepressants": "ssri",
+    "opioid": "opioid", "opioids": "opioid", "benzodiazepine": "benzodiazepine", "benzodiazepines": "benzodiazepine",
+    "antibiotic": "antibiotic", "antibiotics": "antibiotic", "antihistamine": "antihistamine",
+    "antihistamines": "antihistamine", "steroid": "corticosteroid", "steroids": "corticosteroid"
+}
+
+# (drug or class, drug or class, risk_level, warning). A class paired with itself flags
+# duplicate therapy.
+INTERACTIONS = [
+    ("anticoagulant", "nsaid", "high", "NSAIDs with an anticoagulant sharply increase bleeding risk"),
+    ("anticoagulant", "antiplatelet", "high", "Combining anticoagulant and antiplatelet therapy increases bleeding risk"),
+    ("warfarin", "inr_raising", "high", "This antimicrobial raises INR in patients on warfarin"),
+    ("warfarin", "acetaminophen", "medium", "Regular acetaminophen above 2 g/day can raise INR on warfarin"),
+    ("nsaid", "nsaid", "medium", "Two NSAIDs together add GI bleeding and kidney risk without extra benefit"),
+    ("nsaid", "corticosteroid", "medium", "NSAIDs with corticosteroids increase GI bleeding risk"),
+    ("nsaid", "ace_inhibitor", "medium", "NSAIDs reduce the effect of ACE inhibitors and can impair kidney function"),
+    ("nsaid", "lithium", "high", "NSAIDs raise lithium levels and can cause toxicity"),
+    ("nsaid", "methotrexate", "high", "NSAIDs reduce methotrexate clearance and can cause toxicity"),
+    ("ace_inhibitor", "potassium_sparing", "high", "ACE inhibitor with a potassium-sparing diuretic risks hyperkalemia"),
+    ("ace_inhibitor", "lithium", "high", "ACE inhibitors raise lithium levels"),
+    ("ssri", "nsaid", "medium", "SSRIs with NSAIDs increase GI bleeding risk"),
+    ("serotonergic", "serotonergic", "high", "Combining serotonergic drugs risks serotonin syndrome"),
+    ("opioid", "benzodiazepine", "critical", "Opioids with benzodiazepines risk fatal respiratory depression"),
+    ("opioid", "sedative", "high", "Opioids with sedating drugs add to respiratory depression"),
+    ("pde5_inhibitor", "nitrate", "critical", "PDE5 inhibitors with nitrates can cause severe hypotension"),
+    ("statin", "cyp3a4_inhibitor", "high", "This CYP3A4 inhibitor raises statin levels and rhabdomyolysis risk"),
+    ("digoxin", "clarithromycin", "high", "Clarithromycin raises digoxin levels"),
+    ("methotrexate", "trimethoprim-sulfamethoxazole", "critical", "Trimethoprim-sulfamethoxazole with methotrexate risks bone marrow suppression")
+]
+
+_RISK_RANK = {"low": 0, "medium": 1, "high": 2, "critical": 3}
+_UNIT_MG = {"mg": 1.0, "mcg": 0.001, "µg": 0.001, "g": 1000.0}
+_TIMES_PER_DAY = {"once": 1, "twice": 2, "three": 3, "thrice": 3, "four": 4, "qd": 1, "bid": 2, "tid": 3, "qid": 4}
+
+# One scan over the text yields every token the pre-check cares about, left to right.
+_TOKEN_RE = re.compile(
+    r"(?P<dose>\d[\d,]*(?:\.\d+)?)(?:\s*(?:-|–|to)\s*(?P<dose_hi>\d[\d,]*(?:\.\d+)?))?\s*(?P<unit>mg|mcg|µg|g|ml)\b"
+    r"(?P<per_day>\s*(?:/\s*day|per\s+day|a\s+day|each\s+day|daily))?"
+    r"|every\s+(?P<hours>\d+)(?:\s*(?:-|–|to)\s*(?P<hours_hi>\d+))?\s*(?:hours?|hrs?|h)\b"
+    r"|(?P<times>once|twice|thrice|three|four)(?:\s+times)?\s+(?:a\s+day|daily|per\s+day)|\b(?P<abbrev>qd|bid|tid|qid)\b"
+    r"|(?P<limit>max(?:imum)?|up\s+to|at\s+most|(?:do\s+not|don't|never|not)\s+(?:to\s+)?exceed|no\s+more\s+than)\b"
+    r"|(?P<negation>avoid|not|don't|do\s+not|never|stop|discontinue|without|instead\s+of|rather\s+than|no)\b"
+    r"|(?P<reset>but|however|instead)\b"
+    r"|(?P<word>[a-z][a-z'-]*)"
+    r"|(?P<comma>,)|(?P<stop>[.;!?\n])"
+)
+# Drug-like words missing from the index (ACE inhibitors, ARBs, beta blockers, ...) make the
+# pre-check inconclusive instead of silently passing.
+_UNKNOWN_DRUG_RE = re.compile(
+    r"\w{2,}(?:pril|sartan|olol|dipine|statin|azole|cillin|mycin|cycline|floxacin|prazole|tidine|triptan|"
+    r"oxetine|azepam|azolam|profen|coxib|parin|xaban|gliptin|gliflozin|semide|thiazide|codone|morphone)$"
+)
+
+
+class PharmacologyIndex:
+    def __init__(self, drugs=DRUG_INDEX, class_terms=CLASS_TERMS, interactions=INTERACTIONS):
+        self.drugs = drugs
+        self.names = {}
+        for name, (synonyms, classes, _, _) in drugs.items():
+            for variant in [name, *synonyms]:
+                self.names[variant] = name
+        self.class_terms = class_terms
+        # Multi-word names are looked up by their first word, longest first.
+        self.phrases = {}
+        for variant in sorted([*self.names, *class_terms], key=len, reverse=True):
+            if " " in variant:
+                self.phrases.setdefault(variant.split(" ", 1)[0], []).append(variant)
+        self.interactions = {}
+        for a, b, risk, warning in interactions:
+            self.interactions[frozenset((a, b))] = (risk, warning)
+
+    def tags(self, name: str) -> set:
+        if name in self.drugs:
+            return {name, *self.drugs[name][1]}
+        return {name}
+
+    def _lookup(self, text: str, start: int, word: str):
+        # Returns (canonical, is_class, end) for the drug or class named at `start`.
+        for phrase in self.phrases.get(word, ()):
+            end = start + len(phrase)
+            if text.startswith(phrase, start) and (end == len(text) or not text[end].isalnum()):
+                return self.names.get(phrase, self.class_terms.get(phrase)), phrase in self.class_terms, end
+        for candidate in (word, word[:-1] if word.endswith("s") else None):
+            if candidate in self.names:
+                return self.names[candidate], False, start + len(word)
+            if candidate in self.class_terms:
+                return self.class_terms[candidate], True, start + len(word)
+        return None
+
+    def scan(self, text: str) -> Dict[str, List]:
+        # Mentions carry their doses; a dose or frequency belongs to the last mention in the
+        # same sentence. Negation runs to the end of the clause, but "avoid ibuprofen,
+        # aspirin or naproxen" keeps it across a list of drugs.
+        text = (text or "").lower()
+        mentions, unknown, orphan_doses = [], [], []
+        current = last = None
+        negated = False
+        after_comma = False
+        limit = False
+        skip_until = 0
+        for token in _TOKEN_RE.finditer(text):
+            if token.start() < skip_until:
+                continue
+            kind = token.lastgroup
+            if kind in ("hours", "hours_hi", "times", "abbrev"):
+                kind = "frequency"
+            elif kind in ("dose", "dose_hi", "unit", "per_day"):
+                kind = "dose"
+            if after_comma and kind == "word" and token.group(0) not in ("or", "and", "nor"):
+                after_comma = False
+                if self._lookup(text, token.start(), token.group(0)) is None:
+                    negated = False
+            if kind == "stop":
+                current, negated, limit = None, False, False
+            elif kind == "reset":
+                negated = False
+            elif kind == "comma":
+                after_comma = negated
+            elif kind == "negation":
+                negated = True
+            elif kind == "limit":
+                limit = True
+            elif kind == "dose":
+                amount = float((token.group("dose_hi") or token.group("dose")).replace(",", ""))
+                unit = token.group("unit")
+                dose = {"text": token.group(0).strip(), "mg": amount * _UNIT_MG[unit] if unit in _UNIT_MG else None,
+                        "daily": bool(token.group("per_day")) or limit, "per_day": None}
+                # "Do not exceed 3200 mg per day." caps the drug from the previous sentence.
+                target = current or (last if limit else None)
+                if target is None:
+                    orphan_doses.append(dose["text"])
+                else:
+                    target["doses"].append(dose)
+                limit = False
+            elif kind == "frequency" and current is not None and current["doses"]:
+                if token.group("hours"):
+                    per_day = 24 / max(int(token.group("hours_hi") or token.group("hours")), 1)
+                else:
+                    per_day = _TIMES_PER_DAY[token.group("times") or token.group("abbrev")]
+                current["doses"][-1]["per_day"] = per_day
+            elif kind == "word":
+                word = token.group(0)
+                found = self._lookup(text, token.start(), word)
+                if found is None:
+                    if _UNKNOWN_DRUG_RE.match(word):
+                        current = last = None  # its dose must not land on the previous drug
+                        if not negated:
+                            unknown.append(word)
+                    continue
+                name, is_class, skip_until = found
+                current = last = {"name": name, "is_class": is_class, "negated": negated, "doses": []}
+                mentions.append(current)
+        return {"mentions": mentions, "unknown": unknown, "orphan_doses": orphan_doses}
+
+    def check(self, treatment: str, context: str = "") -> Dict[str, object]:
+        # verdict is "unsafe" (a known interaction or out-of-range dose), "safe" (every drug
+        # was recognised and checked) or "inconclusive" (something could not be checked).
+        # "safe" only covers what the index knows: allergies, pregnancy, comorbidities and
+        # the presentation itself are still the LLM validator's job.
+        scanned = self.scan(treatment)
+        prescribed = [m for m in scanned["mentions"] if not m["negated"]]
+        # Medications the patient mentions alongside the symptoms count for interactions only.
+        taking = [m for m in self.scan(context)["mentions"] if not m["negated"] and not m["is_class"]]
+        findings, unresolved = [], []
+
+        for mention in prescribed:
+            if mention["is_class"] or mention["name"] not in self.drugs:
+                continue
+            _, _, single_range, max_daily = self.drugs[mention["name"]]
+            for dose in mention["doses"]:
+                if dose["mg"] is None or single_range is None:
+                    unresolved.append(f"unchecked dose for {mention['name']}: {dose['text']}")
+                    continue
+                daily = dose["mg"] if dose["daily"] else dose["mg"] * dose["per_day"] if dose["per_day"] else None
+                if not dose["daily"] and not single_range[0] <= dose["mg"] <= single_range[1]:
+                    findings.append(("high", f"{mention['name']} {dose['text']} is outside the usual "
+                                             f"{single_range[0]:g}-{single_range[1]:g} mg single dose"))
+                elif daily is not None and max_daily is not None and daily > max_daily:
+                    total = dose["text"] if dose["daily"] else f"{dose['text']} adds up to {daily:g} mg/day,"
+                    findings.append(("high", f"{mention['name']} {total} above the {max_daily:g} mg daily maximum"))
+
+        prescribed_names = {m["name"] for m in prescribed}
+        drugs = {m["name"]: m["is_class"] for m in prescribed + taking}
+        names = sorted(drugs)
+        for i, a in enumerate(names):
+            for b in names[i + 1:]:
+                if a not in prescribed_names and b not in prescribed_names:
+                    continue  # the patient's existing combination is not this plan's doing
+                for x in self.tags(a):
+                    # "an NSAID such as ibuprofen" names one drug, not duplicate therapy.
+                    hit = next((self.interactions[frozenset((x, y))] for y in self.tags(b)
+                                if frozenset((x, y)) in self.interactions
+                                and (x != y or not (drugs[a] or drugs[b]))), None)
+                    if hit:
+                        findings.append((hit[0], f"{hit[1]} ({a} + {b})"))
+                        break
+
+        unresolved += [f"unrecognised medication: {word}" for word in scanned["unknown"]]
+        unresolved += [f"dose without a recognised drug: {dose}" for dose in scanned["orphan_doses"]]
+        unresolved += [f"narrow therapeutic index: {m['name']}" for m in prescribed + taking
+                       if m["name"] in NARROW_THERAPEUTIC_INDEX]
+        unresolved += [f"dosed drug named only by class: {m['name']}" for m in prescribed if m["is_class"] and m["doses"]]
+
+        if findings:
+            verdict = "unsafe"
+        elif unresolved:
+            verdict = "inconclusive"
+        else:
+            verdict = "safe"
+        return {"verdict": verdict, "drugs": sorted({m["name"] for m in prescribed}),
+                "taking": sorted({m["name"] for m in taking}),
+                "findings": [{"risk_level": risk, "warning": warning} for risk, warning in dict.fromkeys(findings)],
+                "unresolved": unresolved}
+
+
+pharmacology_index = PharmacologyIndex()
+
+_precheck_stats = {"safe": 0, "unsafe": 0, "inconclusive": 0}
+_precheck_lock = threading.Lock()
+
+
+def precheck_treatment_safety(treatment: str, context: str = "") -> Optional[Dict[str, object]]:
+    # Same shape as the LLM safety validator's verdict when a known interaction or dosing
+    # error is found, otherwise None: a clean index check never rules out contraindications,
+    # so the LLM still has to run.
+    report = pharmacology_index.check(treatment, context)
+    with _precheck_lock:
+        _precheck_stats[report["verdict"]] += 1
+    if report["verdict"] != "unsafe":
+        return None
+    findings = sorted(report["findings"], key=lambda f: -_RISK_RANK[f["risk_level"]])
+    return {"safe": False, "warning": "; ".join(f["warning"] for f in findings),
+            "risk_level": findings[0]["risk_level"], "source": "precheck"}
+
+
+def precheck_stats() -> Dict[str, float]:
+    # skip_rate is the share of safety checks answered without calling the LLM, which
+    # only happens on an "unsafe" finding.
+    with _precheck_lock:
+        total = sum(_precheck_stats.values())
+        return {**_precheck_stats, "total": total, "skip_rate": _precheck_stats["unsafe"] / total if total else 0.0}
+
+
+if __name__ == "__main__":
+    examples = [
+        ("Ibuprofen 400 mg every 6 hours with food; rest and fluids.", ""),
+        ("Acetaminophen 1000 mg every 4 hours for fever.", ""),
+        ("Take naproxen 500 mg twice daily.", "I take warfarin for atrial fibrillation"),
+        ("Avoid NSAIDs, take acetaminophen 500 mg every 6 hours, max 3000 mg per day.", ""),
+        ("Start losartan 50 mg daily and recheck blood pressure.", ""),
+        ("Rest, hydration and a cool compress.", "")
+    ]
+    for treatment, context in examples:
+        report = pharmacology_index.check(treatment, context)
+        print(f"{report['verdict']:>12} | {treatment}")
+        for finding in report["findings"]:
+            print(f"{'':>12}   {finding['risk_level']}: {finding['warning']}")
+        for reason in report["unresolved"]:
+            print(f"{'':>12}   ? {reason}")
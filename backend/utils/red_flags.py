@@ -0,0 +1,163 @@
+import re
+import time
+from typing import Dict, List, Optional, Sequence
+
+# Emergency red flags checked before any model call. Each rule is (name, pattern, urgency,
+# disposition, min_severity): a rule with min_severity only fires when the patient-reported
+# severity (1-10 slider) is at least that high. Rules are ordered most severe first.
+RED_FLAG_RULES = [
+    ("cardiac chest pain",
+     r"(crushing|squeezing|pressure|tight\w*|heavy)\W+(\w+\W+){0,3}chest|chest\W+(\w+\W+){0,3}(pain|pressure|tightness)\W+(\w+\W+){0,5}(radiat\w*|spread\w*|going)\W+(\w+\W+){0,3}(arm|jaw|neck|back|shoulder)",
+     "IMMEDIATE", "911", None),
+    ("stroke signs",
+     r"(face|facial)\W+(\w+\W+){0,2}(droop\w*|drooping)|slurred\W+speech|(sudden\w*|one)\W+(\w+\W+){0,3}(weakness|numbness)\W+(\w+\W+){0,4}(side|arm|leg|face)|can'?t\W+(speak|talk|lift (my|his|her) arm)",
+     "IMMEDIATE", "911", None),
+    ("severe breathing difficulty",
+     r"can'?t\W+breathe|cannot\W+breathe|unable\W+to\W+breathe|struggling\W+to\W+breathe|gasping|choking|(blue|gr[ae]y)\W+lips",
+     "IMMEDIATE", "911", None),
+    ("anaphylaxis",
+     r"anaphyla\w*|(throat|tongue|lips?)\W+(\w+\W+){0,2}(swell\w*|swollen|closing)|swollen\W+(throat|tongue)",
+     "IMMEDIATE", "911", None),
+    ("loss of consciousness",
+     r"unconscious|unresponsive|passed\W+out|fainted|not\W+waking\W+up",
+     "IMMEDIATE", "911", None),
+    ("suicide or self-harm risk",
+     r"suicid\w*|kill\W+my\W*self|end\W+my\W+life|want\W+to\W+die|self[\W-]*harm\w*|overdos\w*",
+     "IMMEDIATE", "911", None),
+    ("thunderclap headache",
+     r"worst\W+headache|thunderclap|sudden\w*\W+(\w+\W+){0,2}(severe|excruciating)\W+headache",
+     "IMMEDIATE", "ED", None),
+    ("major bleeding",
+     r"(vomit\w*|cough\w*)\W+(up\W+)?blood|blood\w*\W+(\w+\W+){0,2}(won'?t|will not|doesn'?t)\W+stop|heavy\W+bleeding|black\W+(tarry\W+)?stools?",
+     "IMMEDIATE", "ED", None),
+    ("prolonged seizure",
+     r"seizure\w*\W+(\w+\W+){0,3}(minutes|won'?t stop|not stopping)|first\W+(ever\W+)?seizure|seizing",
+     "IMMEDIATE", "911", None),
+    ("chest pain",
+     r"chest\W+(\w+\W+){0,2}(pain|pressure|tightness|hurts)",
+     "URGENT", "ED", 7),
+    ("high fever with stiff neck",
+     r"stiff\W+neck",
+     "URGENT", "ED", 6),
+    ("severe pain",
+     r"\bpain\b|\bhurts?\b|\bache\b",
+     "URGENT", "URGENT_CARE", 9)
+]
+
+IMMEDIATE_ACTIONS = {
+    "911": ["Call 911 (or your local emergency number) now", "Do not drive yourself; stay with someone if possible",
+            "Unlock the door and keep your phone nearby"],
+    "ED": ["Go to the nearest emergency department now", "Do not eat or drink until assessed",
+           "Bring a list of your medications"],
+    "URGENT_CARE": ["Seek urgent care today", "Call 911 if symptoms suddenly worsen"]
+}
+CRISIS_ACTION = "If you are thinking about harming yourself, call or text 988 (Suicide & Crisis Lifeline) now"
+
+_URGENCY_RANK = {"IMMEDIATE": 0, "URGENT": 1}
+_DISPOSITION_RANK = {"911": 0, "ED": 1, "URGENT_CARE": 2, "PRIMARY_CARE": 3}
+# "no chest pain", "denies shortness of breath", "without fainting": a negation covers at
+# most three words up to the match and ends at punctuation or a conjunction, so "no fever
+# but now my face is drooping" still fires.
+_CLAUSE_BREAK = r"(?:but|however|now|though|although|yet|then|except|until|before|after|and|so|because)\b"
+_NEGATION_RE = re.compile(rf"\b(?:no|not|denies|denied|without|never|negative for)[^\w.;,!?]+"
+                          rf"(?:(?!{_CLAUSE_BREAK})\w+[^\w.;,!?]+){{0,3}}$")
+NEGATION_WINDOW = 40
+LATENCY_SLO_MS = 1.0
+
+
+class RedFlagEngine:
+    def __init__(self, rules=RED_FLAG_RULES):
+        # Anchoring every alternative at a word boundary lets the scan reject most positions
+        # on the first character; the text is lowercased once instead of matching IGNORECASE.
+        self.rules = [(name, re.compile(rf"\b(?:{pattern})"), urgency, disposition, min_severity)
+                      for name, pattern, urgency, disposition, min_severity in rules]
+
+    def matches(self, text: str, severity: Optional[float] = None) -> List[Dict[str, str]]:
+        found = []
+        text = text.lower()
+        for name, pattern, urgency, disposition, min_severity in self.rules:
+            if min_severity is not None and (severity is None or severity < min_severity):
+                continue
+            for match in pattern.finditer(text):
+                if not _NEGATION_RE.search(text, max(0, match.start() - NEGATION_WINDOW), match.start()):
+                    found.append({"flag": name, "urgency": urgency, "disposition": disposition,
+                                  "evidence": match.group(0)})
+                    break
+        return found
+
+    def assess(self, text: str, severity: Optional[float] = None) -> Optional[Dict[str, object]]:
+        # Same shape as EmergencyAgent.triage_urgency, so either can be shown to the user.
+        started = time.perf_counter()
+        found = self.matches(text or "", severity)
+        if not found:
+            return None
+        urgency = min((flag["urgency"] for flag in found), key=_URGENCY_RANK.get)
+        disposition = min((flag["disposition"] for flag in found), key=_DISPOSITION_RANK.get)
+        actions = list(IMMEDIATE_ACTIONS[disposition])
+        if any(flag["flag"] == "suicide or self-harm risk" for flag in found):
+            actions.insert(0, CRISIS_ACTION)
+        return {
+            "urgency": urgency,
+            "disposition": disposition,
+            "red_flags": [flag["flag"] for flag in found],
+            "evidence": [flag["evidence"] for flag in found],
+            "immediate_actions": actions,
+            "latency_ms": 1000 * (time.perf_counter() - started)
+        }
+
+
+red_flag_engine = RedFlagEngine()
+
+
+def assess_red_flags(text: str, severity: Optional[float] = None) -> Optional[Dict[str, object]]:
+    return red_flag_engine.assess(text, severity)
+
+
+# Negated words elsewhere in these sentences must not hide the emergency.
+MUST_FIRE_CASES = [
+    "I had no fever but now my face is drooping",
+    "no chest pain but I fainted",
+    "I am not sure but I think I cannot breathe",
+    "never had this before crushing chest pain radiating to my arm"
+]
+
+SLO_CASES = [
+    "Crushing chest pain radiating to my left arm and jaw, sweating",
+    "My father's face is drooping on one side and his speech is slurred",
+    "Persistent cough for 3 days, mild fever, headache",
+    "I have no chest pain but my knee hurts when I climb stairs",
+    "Rash on both forearms that itches at night after gardening",
+    "Worst headache of my life started suddenly an hour ago",
+    "I feel anxious and can't sleep, sometimes I want to die",
+    "Stomach ache after eating, some nausea, no vomiting blood"
+] + MUST_FIRE_CASES
+
+
+def check_latency_slo(cases: Sequence[str] = SLO_CASES, budget_ms: float = LATENCY_SLO_MS,
+                      repeats: int = 200) -> Dict[str, float]:
+    # The fast path only helps if it is effectively free: p99 over realistic inputs must
+    # stay under budget_ms (padded to a long message to cover worst-case input sizes).
+    inputs = list(cases) + [" ".join(cases) * 3]
+    timings = []
+    for _ in range(repeats):
+        for text in inputs:
+            started = time.perf_counter()
+            red_flag_engine.assess(text, severity=10)
+            timings.append(1000 * (time.perf_counter() - started))
+    timings.sort()
+    p99 = timings[int(0.99 * (len(timings) - 1))]
+    return {"samples": len(timings), "p50_ms": timings[len(timings) // 2], "p99_ms": p99,
+            "budget_ms": budget_ms, "passed": p99 < budget_ms}
+
+
+if __name__ == "__main__":
+    import sys
+    for case in SLO_CASES:
+        result = assess_red_flags(case, severity=5)
+        print(f"{'EMERGENCY ' + result['disposition'] if result else 'none':>14} | {case}")
+    missed = [case for case in MUST_FIRE_CASES if assess_red_flags(case) is None]
+    for case in missed:
+        print(f"MISSED red flag | {case}")
+    report = check_latency_slo()
+    print(f"p50 {report['p50_ms']:.3f} ms, p99 {report['p99_ms']:.3f} ms (budget {report['budget_ms']} ms)")
+    sys.exit(0 if report["passed"] and not missed else 1)
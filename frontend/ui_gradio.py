@@ -18,7 +18,10 @@ from backend.agents.monitoring_agent import analyze_patient_history,generate_mon
 from backend.agents.qa_agent import answer_medical_question
 from backend.agents.report_agent import write_report
 from backend.agents.treatment_agent import generate_treatment
+from backend.utils.red_flags import assess_red_flags
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
+NO_TREATMENT_NOTE = "ℹ️ No treatment plan was needed for this question."
 relevant_responses = "backend/logs/relevant_diagnosis.csv"
 irrelevant_responses = "backend/logs/irrelevant_responses.csv"
 
@@ -107,7 +110,18 @@ AI Analysis:
         return f"❌ Error analyzing image: {str(e)}"
 
 
-def analyze_input_enhanced(symptoms, image, image_type, image_caption=""):
+SAFETY_PENDING_BADGE = "🛡️ Safety check pending... (this plan has not been verified yet)"
+SAFETY_PASSED_BADGE = "✅ Safety check passed"
+
+
+def analyze_input_enhanced(symptoms, image, image_type, image_caption="", session_id="default"):
+    diagnosis, treatment, image_analysis, _ = run_analysis(symptoms, image, image_type, image_caption, session_id)
+    return diagnosis, treatment, image_analysis
+
+
+def run_analysis(symptoms, image, image_type, image_caption="", session_id="default", defer_safety=False):
+    # Also returns the workflow log; with defer_safety it carries the pending safety check.
+    workflow_log = {}
     image_analysis = ""
     if image is not None:
         if image_caption.strip():
@@ -120,11 +134,18 @@ def analyze_input_enhanced(symptoms, image, image_type, image_caption=""):
         return (
             "⚠️ Blank input. Please provide symptoms ",
             "",
-            "⚠️ No image analysis available"
+            "⚠️ No image analysis available",
+            workflow_log
         )    
     
     try:
-        diagnosis, treatment, _ = orchestrator.coordinate_diagnosis_workflow(symptoms)
+        # The query's intent decides which workflow steps run (a general question skips treatment).
+        outputs, workflow_log = orchestrator.coordinate_intent_workflow(symptoms, session_id, defer_safety=defer_safety)
+        diagnosis = outputs.get("diagnosis") or outputs.get("monitoring_summary") or outputs.get("report") or \
+            "⚠️ Sorry, the consultation could not be completed. Please try again."
+        ran = {entry["step"]: entry["status"] for entry in workflow_log.get("trace", [])}
+        diagnosed_only = ran.get("diagnose") == "ok" and "recommend_treatment" not in ran
+        treatment = outputs.get("treatment", NO_TREATMENT_NOTE if diagnosed_only else "")
         os.makedirs(os.path.dirname(relevant_responses), exist_ok=True)
         os.makedirs(os.path.dirname(irrelevant_responses), exist_ok=True)
 
@@ -142,7 +163,8 @@ def analyze_input_enhanced(symptoms, image, image_type, image_caption=""):
             return (
                 diagnosis,
                 "",
-                "⚠️ Irrelevant query, no image analysis"
+                "⚠️ Irrelevant query, no image analysis",
+                workflow_log
             )
 
         log_df = pd.DataFrame([{
@@ -161,29 +183,94 @@ def analyze_input_enhanced(symptoms, image, image_type, image_caption=""):
         return (
             enhanced_diagnosis,
             treatment,
-            image_analysis if image else "📷 No image provided"
+            image_analysis if image else "📷 No image provided",
+            workflow_log
         )
     
     except Exception as e:
         return (
             f"⚠️ Error during analysis: {str(e)}",
             "",
-            image_analysis if image else "No image provided"
+            image_analysis if image else "No image provided",
+            workflow_log
         )
 
+DISPOSITION_LABELS = {
+    "911": "CALL 911 NOW",
+    "ED": "GO TO THE EMERGENCY DEPARTMENT NOW",
+    "URGENT_CARE": "SEEK URGENT CARE TODAY",
+    "PRIMARY_CARE": "See your doctor"
+}
+DISPOSITION_ORDER = ["911", "ED", "URGENT_CARE", "PRIMARY_CARE"]
+
+
+def format_emergency(assessment, note=""):
+    text = f"🚨 {DISPOSITION_LABELS.get(assessment['disposition'], assessment['disposition'])} 🚨\n"
+    text += f"Urgency: {assessment['urgency']}\n"
+    text += f"Warning signs: {', '.join(assessment['red_flags'])}\n\n"
+    text += "\n".join(f"• {action}" for action in assessment["immediate_actions"])
+    return f"{text}\n\n{note}" if note else text
+
+
+def merge_triage(assessment, triage):
+    # The model may add red flags and actions but never downgrades the rule-based disposition.
+    merged = dict(assessment)
+    if triage.get("disposition") in DISPOSITION_ORDER and \
+            DISPOSITION_ORDER.index(triage["disposition"]) < DISPOSITION_ORDER.index(assessment["disposition"]):
+        merged["disposition"] = triage["disposition"]
+    merged["red_flags"] = list(dict.fromkeys(assessment["red_flags"] + triage.get("red_flags", [])))
+    merged["immediate_actions"] = list(dict.fromkeys(assessment["immediate_actions"] + triage.get("immediate_actions", [])))
+    return merged
+
+
 # For textual analysis
-def analyze_text_only(symptoms, severity):
+def analyze_text_only(symptoms, severity, request: gr.Request):
     symptoms_with_severity = f"{symptoms} (Severity: {severity}/10)"
-    diagnosis, treatment, _ = analyze_input_enhanced(symptoms_with_severity, None, None, "")
-    return (
-        gr.update(value=diagnosis),
-        gr.update(value=treatment)
-    )
+    # Red flags are checked before any model call, so an emergency is on screen at once;
+    # EmergencyAgent and the full workflow then fill in behind it.
+    emergency = assess_red_flags(symptoms, severity)
+    if emergency is None:
+        # The plan is shown as soon as it exists; the safety verdict replaces the badge when it lands.
+        diagnosis, treatment, _, workflow_log = run_analysis(symptoms_with_severity, None, None, "",
+                                                             request.session_hash, defer_safety=True)
+        if "safety_pending" not in workflow_log:
+            yield gr.update(value=diagnosis), gr.update(value=treatment)
+            return
+        yield gr.update(value=diagnosis), gr.update(value=f"{SAFETY_PENDING_BADGE}\n\n{treatment}")
+        try:
+            treatment, safety_check = orchestrator.resolve_deferred_safety(workflow_log, treatment, request.session_hash)
+        except Exception as e:
+            print(f"[UI] Deferred safety check failed: {e}")
+            yield gr.update(), gr.update(value=f"⚠️ Safety check could not be completed; review this plan with a clinician.\n\n{treatment}")
+            return
+        if safety_check.get("safe", True):
+            treatment = f"{SAFETY_PASSED_BADGE}\n\n{treatment}"
+        else:
+            gr.Warning(f"Safety alert: {safety_check.get('warning') or 'review the treatment plan before acting on it'}")
+        yield gr.update(), gr.update(value=treatment)
+        return
+
+    pending = "⏳ Detailed assessment in progress..."
+    yield gr.update(value=format_emergency(emergency, pending)), gr.update(value=pending)
+    executor = ThreadPoolExecutor(max_workers=2)
+    triage = executor.submit(orchestrator.emergency_agent.triage_urgency, symptoms_with_severity)
+    analysis = executor.submit(analyze_input_enhanced, symptoms_with_severity, None, None, "", request.session_hash)
+    executor.shutdown(wait=False)
+    diagnosis, treatment = pending, pending
+    for future in as_completed([triage, analysis]):
+        try:
+            if future is triage:
+                emergency = merge_triage(emergency, future.result())
+            else:
+                diagnosis, treatment, _ = future.result()
+        except Exception as e:
+            print(f"[UI] Emergency enrichment failed: {e}")
+        yield gr.update(value=format_emergency(emergency, diagnosis)), gr.update(value=treatment)
 
 
 # For image analysis
-def analyze_image_only(image, image_type, image_caption):
-    diagnosis, treatment, image_analysis = analyze_input_enhanced("", image, image_type, image_caption)
+def analyze_image_only(image, image_type, image_caption, request: gr.Request):
+    diagnosis, treatment, image_analysis = analyze_input_enhanced("", image, image_type, image_caption, request.session_hash)
     return (
         gr.update(value=diagnosis),
         gr.update(value=treatment),